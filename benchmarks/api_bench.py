@@ -0,0 +1,95 @@
+"""Drive every API endpoint in-process through the ASGI interface
+
+    python benchmarks/api_bench.py --users 100000 --evaluations 1000000 --concurrency 32
+
+Requests go straight into the FastAPI app (no sockets, no HTTP client), so
+the numbers isolate handler + SQLite cost from network overhead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from common import ROOT, add_common_args, drive, prepare_db, write_report
+
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "src", "api"))
+
+
+async def asgi_request(app, method, path, body=None):
+    """Minimal ASGI round-trip; raises on 5xx so it counts as an error"""
+    path, _, query = path.partition("?")
+    payload = json.dumps(body).encode() if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query.encode(), "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(payload)).encode())],
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    sent = False
+    status = 0
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            await asyncio.sleep(3600)
+        sent = True
+        return {"type": "http.request", "body": payload, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    if status >= 500:
+        raise RuntimeError(f"{method} {path} -> {status}")
+    return status
+
+
+def scenarios(users):
+    rng = random.Random(1)
+    return {
+        "GET /leaderboard": lambda i: ("GET", "/leaderboard?limit=20", None),
+        "GET /leaderboard?task_type=": lambda i: ("GET", "/leaderboard?limit=20&task_type=analysis", None),
+        "GET /agents/trending": lambda i: ("GET", "/agents/trending", None),
+        "GET /users/{id}/stats": lambda i: ("GET", f"/users/{rng.randint(1, users)}/stats", None),
+        "GET /users/{id}/history": lambda i: ("GET", f"/users/{rng.randint(1, users)}/history?bucket=day", None),
+        "GET /evaluations/{id}": lambda i: ("GET", f"/evaluations/{rng.randint(1, users)}", None),
+        "POST /evaluations": lambda i: ("POST", "/evaluations", {
+            "from_user_id": rng.randint(1, users), "to_user_id": rng.randint(1, users),
+            "rating": rng.randint(1, 5), "comment": "bench", "task_type": "general"}),
+    }
+
+
+async def run(args):
+    dataset = prepare_db(args)
+    from main import app, lifespan
+
+    results = {}
+    async with lifespan(app):
+        for name, make in scenarios(args.users).items():
+            if args.only and args.only not in name:
+                continue
+
+            async def call(i, make=make):
+                await asgi_request(app, *make(i))
+
+            results[name] = await drive(call, args.requests, args.concurrency)
+    return write_report("api", dataset, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.add_argument("--only", help="run scenarios whose name contains this string")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
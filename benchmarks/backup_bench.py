@@ -0,0 +1,91 @@
+"""create_evaluation latency while an online snapshot runs
+
+One thread commits evaluations back to back (apply_evaluation + commit, as
+the API does in direct mode) and records each latency. It runs once with no
+backup as the baseline, then once per --pages setting while a separate
+process takes snapshots with backup.py in a loop.
+
+    python benchmarks/backup_bench.py --evaluations 1000000 --pages -1 1024 128 --pause 0.005
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "api"))
+
+from backup import create_snapshot  # noqa: E402
+from common import add_common_args, prepare_db, summarize, write_report  # noqa: E402
+from writer import apply_evaluation, connect_writable  # noqa: E402
+
+
+def _snapshotter(db_path, backup_dir, pages, pause, stop, snapshots):
+    while not stop.is_set():
+        create_snapshot(db_path, backup_dir, pages, pause)
+        shutil.rmtree(backup_dir)
+        with snapshots.get_lock():
+            snapshots.value += 1
+
+
+def measure(db_path, users, duration):
+    conn = connect_writable(db_path)
+    rng = random.Random(0)
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        t = time.perf_counter()
+        apply_evaluation(conn, rng.randint(1, users), rng.randint(1, users), rng.randint(1, 5), "bench")
+        conn.commit()
+        latencies.append(time.perf_counter() - t)
+    conn.close()
+    return summarize(latencies, 0, time.perf_counter() - start, 1)
+
+
+def run(db_path, users, duration, pages=None, pause=0.0):
+    if pages is None:
+        return measure(db_path, users, duration)
+    stop = multiprocessing.Event()
+    snapshots = multiprocessing.Value("q", 0)
+    backup_dir = tempfile.mkdtemp(prefix="atn-backup-bench-")
+    proc = multiprocessing.Process(target=_snapshotter, args=(db_path, backup_dir, pages, pause, stop, snapshots))
+    proc.start()
+    time.sleep(0.2)
+    try:
+        result = measure(db_path, users, duration)
+    finally:
+        stop.set()
+        proc.join()
+        shutil.rmtree(backup_dir, ignore_errors=True)
+    result["snapshots"] = snapshots.value
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario")
+    parser.add_argument("--pages", type=int, nargs="+", default=[-1, 1024, 128], help="pages per backup step")
+    parser.add_argument("--pause", type=float, default=0.005, help="sleep between backup steps")
+    args = parser.parse_args()
+    dataset = prepare_db(args)
+    dataset["db_bytes"] = os.path.getsize(args.db)
+
+    results = {"no_backup": run(args.db, args.users, args.duration)}
+    for pages in args.pages:
+        name = f"backup_pages_{'all' if pages < 0 else pages}"
+        results[name] = run(args.db, args.users, args.duration, pages, args.pause)
+    for name, result in results.items():
+        print(f"{name:>20}: p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  "
+              f"max {result['max_ms']:.3f} ms", file=sys.stderr)
+    write_report("backup_impact", dataset, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""POST /users/stats:batch vs. one GET /users/{id}/stats per agent
+
+Each call renders a "dashboard" of --batch random agents, either with one
+batch request or by fanning out --batch concurrent single-user requests
+(what the dashboards did before). Both go in-process through ASGI, so the
+gap is handler and SQLite overhead, before any network round-trips.
+
+    python benchmarks/batch_bench.py --batch 10 50 200 --requests 200
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+
+from api_bench import asgi_request
+from common import add_common_args, drive, prepare_db, write_report
+
+
+async def run(args):
+    dataset = prepare_db(args)
+    from main import app, lifespan
+
+    rng = random.Random(1)
+    results = {}
+    async with lifespan(app):
+        for size in args.batch:
+            async def batch(i, size=size):
+                ids = [rng.randint(1, args.users) for _ in range(size)]
+                await asgi_request(app, "POST", "/users/stats:batch", {"user_ids": ids})
+
+            async def fan_out(i, size=size):
+                ids = [rng.randint(1, args.users) for _ in range(size)]
+                await asyncio.gather(*(asgi_request(app, "GET", f"/users/{uid}/stats") for uid in ids))
+
+            for name, call in ((f"batch x{size}", batch), (f"fan-out x{size}", fan_out)):
+                results[name] = await drive(call, args.requests, args.concurrency)
+                print(f"{name:>16}: {results[name]['throughput_rps']:8.1f} dashboards/s  "
+                      f"p99 {results[name]['p99_ms']:.2f} ms", file=sys.stderr)
+    return dataset, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.add_argument("--batch", type=int, nargs="+", default=[10, 50, 200], help="agents per dashboard")
+    parser.set_defaults(requests=200, concurrency=4)
+    args = parser.parse_args()
+    dataset, results = asyncio.run(run(args))
+    write_report("stats_batch", dataset, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
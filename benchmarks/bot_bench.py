@@ -0,0 +1,91 @@
+"""Drive the bot command handlers directly with fake Message objects
+
+    python benchmarks/bot_bench.py --users 100000 --concurrency 32
+
+Nothing talks to Telegram: message.answer() just records the reply, so the
+numbers are handler + SQLite cost only.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+from common import ROOT, add_common_args, drive, prepare_db, write_report
+
+BOT_DIR = os.path.join(ROOT, "src", "bot")
+sys.path.insert(0, BOT_DIR)
+
+# aiogram validates the token format at import time; it is never used
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:BENCHMARK-TOKEN-NOT-USED")
+os.environ.setdefault("ATN_BOT_METRICS_PORT", "0")
+
+
+class FakeMessage:
+    """Just enough of aiogram's Message for the handlers in src/bot/main.py"""
+
+    next_id = itertools.count(1)
+
+    def __init__(self, user_id, text):
+        self.from_user = SimpleNamespace(id=user_id, username=f"agent_{user_id}",
+                                         first_name=f"Agent {user_id}")
+        self.chat = SimpleNamespace(id=user_id)
+        self.message_id = next(FakeMessage.next_id)
+        self.text = text
+        self.replies = []
+
+    async def answer(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def scenarios(bot_main, users):
+    rng = random.Random(1)
+    user = lambda: rng.randint(1, users)  # noqa: E731
+    return {
+        "/start": (bot_main.cmd_start, lambda: "/start"),
+        "/profile": (bot_main.cmd_profile, lambda: "/profile"),
+        "/score": (bot_main.cmd_score, lambda: "/score"),
+        "/reputation": (bot_main.cmd_reputation, lambda: "/reputation"),
+        "/reputation @user": (bot_main.cmd_reputation, lambda: f"/reputation @agent_{user()}"),
+        "/leaderboard": (bot_main.cmd_leaderboard, lambda: "/leaderboard"),
+        "/evaluate": (bot_main.cmd_evaluate, lambda: f"/evaluate @agent_{user()} {rng.randint(1, 5)} bench"),
+        "/find": (bot_main.cmd_find, lambda: f"/find agnet_{user()}"),
+        "/help": (bot_main.cmd_help, lambda: "/help"),
+    }, user
+
+
+async def run(args):
+    dataset = prepare_db(args)
+    # Load by path: seeding puts src/api, with its own main.py, on sys.path too
+    spec = importlib.util.spec_from_file_location("bot_main", os.path.join(BOT_DIR, "main.py"))
+    bot_main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot_main)
+
+    bot_main.init_database()
+    commands, pick_user = scenarios(bot_main, args.users)
+    results = {}
+    for name, (handler, make_text) in commands.items():
+        if args.only and args.only not in name:
+            continue
+
+        async def call(i, handler=handler, make_text=make_text):
+            await handler(FakeMessage(pick_user(), make_text()))
+
+        results[name] = await drive(call, args.requests, args.concurrency)
+    await bot_main.bot.session.close()
+    return write_report("bot", dataset, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.add_argument("--only", help="run commands whose name contains this string")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
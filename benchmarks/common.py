@@ -0,0 +1,108 @@
+"""Shared helpers for the ATN benchmark suite: load driver and JSON reports"""
+
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed, concurrency):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+async def drive(make_call, requests, concurrency):
+    """Run `requests` calls of make_call(i) across `concurrency` workers"""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                await make_call(i)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start, concurrency)
+
+
+def write_report(name, dataset, results, output=None):
+    """Print (and optionally save) a report that compare.py can diff"""
+    report = {
+        "benchmark": name,
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return report
+
+
+def add_common_args(parser):
+    parser.add_argument("--db", default="/tmp/atn-bench.db")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--evaluations", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=2_000, help="calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--reseed", action="store_true", help="rebuild the DB even if it exists")
+    parser.add_argument("--output", help="also write the JSON report here")
+
+
+def prepare_db(args):
+    """Seed args.db unless it exists, then point args.users/evaluations at what it really holds"""
+    from seed import seed
+
+    if args.reseed:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    if not os.path.exists(args.db):
+        seed(args.db, args.users, args.evaluations)
+    # A reused DB may have been seeded with other sizes; report (and pick ids from) its real contents
+    conn = sqlite3.connect(args.db)
+    try:
+        args.users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        args.evaluations = conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+    finally:
+        conn.close()
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    return {"db": args.db, "users": args.users, "evaluations": args.evaluations}
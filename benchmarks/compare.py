@@ -0,0 +1,51 @@
+"""Compare two benchmark reports and flag regressions
+
+    python benchmarks/compare.py baseline.json current.json --threshold 10
+
+Exits non-zero when any scenario's p99 latency grows or throughput drops by
+more than --threshold percent.
+"""
+
+import argparse
+import json
+import sys
+
+
+def pct_change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    print(f"{'scenario':<28} {'rps':>10} {'Δrps%':>8} {'p99 ms':>10} {'Δp99%':>8}")
+    for name, new in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            print(f"{name:<28} {new['throughput_rps']:>10} {'new':>8} {new['p99_ms']:>10} {'new':>8}")
+            continue
+        d_rps = pct_change(old["throughput_rps"], new["throughput_rps"])
+        d_p99 = pct_change(old["p99_ms"], new["p99_ms"])
+        flag = ""
+        if d_rps < -threshold or d_p99 > threshold:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<28} {new['throughput_rps']:>10} {d_rps:>8.1f} {new['p99_ms']:>10} {d_p99:>8.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if compare(baseline, current, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
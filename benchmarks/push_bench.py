@@ -0,0 +1,117 @@
+"""Live leaderboard fan-out: diff delivery latency vs. number of subscribers
+
+    python benchmarks/push_bench.py --subscribers 1000 5000 10000 --slow 0.01
+
+Each round commits an evaluation (and compacts it, so ranks really move),
+then runs one broadcaster poll. Latency is measured from the start of the
+poll to the moment each subscriber has the diff in hand, so it covers
+change detection, the single query + diff + encode, and the fan-out. A
+fraction of subscribers never read; they must be dropped once their queue
+fills rather than slow everyone else down.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+from common import ROOT, add_common_args, percentile, prepare_db, write_report
+
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "src", "api"))
+
+
+async def run_round_set(args, subscribers, conn):
+    from atn_common.eventlog import compact_pending
+    from main import broadcaster_channels
+    from push import Broadcaster
+    from writer import apply_evaluation
+
+    broadcaster = Broadcaster(broadcaster_channels, args.db)
+    rng = random.Random(subscribers)
+    slow = int(subscribers * args.slow)
+    received = []
+    pending = 0
+    round_done = asyncio.Event()
+    round_start = 0.0
+
+    async def consume(subscriber):
+        nonlocal pending
+        while True:
+            message = await subscriber.queue.get()
+            if message is None:
+                return
+            received.append(time.perf_counter() - round_start)
+            pending -= 1
+            if pending == 0:
+                round_done.set()
+
+    start = time.perf_counter()
+    fast = []
+    for i in range(subscribers):
+        subscriber, _ = await broadcaster.subscribe()
+        if i >= slow:
+            fast.append(asyncio.create_task(consume(subscriber)))
+    subscribe_seconds = time.perf_counter() - start
+
+    rounds = []
+    for _ in range(args.rounds):
+        # Top up a random leaderboard entry so every round produces a diff
+        top = conn.execute("SELECT user_id FROM users ORDER BY reputation_score DESC LIMIT 20").fetchall()
+        apply_evaluation(conn, rng.randint(1, args.users), rng.choice(top)[0], rng.randint(1, 5), "bench")
+        compact_pending(conn)
+        conn.commit()
+
+        received.clear()
+        pending = len(fast)
+        round_done.clear()
+        round_start = time.perf_counter()
+        await broadcaster.poll()
+        await asyncio.wait_for(round_done.wait(), 30)
+        rounds.append(sorted(received))
+
+    for task in fast:
+        task.cancel()
+    await broadcaster.stop()
+
+    ms = lambda seconds: round(seconds * 1000, 3)  # noqa: E731
+    return {
+        "subscribers": subscribers,
+        "slow_subscribers": slow,
+        "subscribe_all_ms": ms(subscribe_seconds),
+        "rounds": args.rounds,
+        "first_delivery_p50_ms": ms(percentile(sorted(r[0] for r in rounds), 50)),
+        "last_delivery_p50_ms": ms(percentile(sorted(r[-1] for r in rounds), 50)),
+        "last_delivery_max_ms": ms(max(r[-1] for r in rounds)),
+        "delivery_p99_ms": ms(percentile(sorted(x for r in rounds for x in r), 99)),
+        "dropped": broadcaster.dropped_total,
+    }
+
+
+async def run(args):
+    dataset = prepare_db(args)
+    os.environ["ATN_PUSH_MAX_SUBSCRIBERS"] = str(max(args.subscribers) + 1)
+    from writer import connect_writable
+
+    conn = connect_writable(args.db)
+    results = {}
+    for subscribers in args.subscribers:
+        results[f"{subscribers} subscribers"] = await run_round_set(args, subscribers, conn)
+    conn.close()
+    return write_report("push", dataset, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1_000, 5_000, 10_000])
+    parser.add_argument("--slow", type=float, default=0.01, help="fraction of subscribers that never read")
+    parser.add_argument("--rounds", type=int, default=30, help="must exceed ATN_PUSH_QUEUE_SIZE to see drops")
+    parser.set_defaults(db="/tmp/atn-push.db")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Read throughput of the writer-mode deployment vs. number of uvicorn workers
+
+For each worker count this starts writer.py and `uvicorn main:app --workers N`
+the way src/api/README.md deploys multi-worker mode. Client processes then
+load GET /users/{id}/stats over HTTP, and one more client keeps POSTing
+evaluations, which the API forwards to the writer. So the numbers include
+HTTP, the handler, WAL snapshots and group commits, not just the SQL.
+
+    python benchmarks/read_scaling.py --workers 1 2 4 8 --duration 10
+
+Needs uvicorn (src/api/requirements.txt). Keep --clients * --threads well
+above the largest worker count so the load generator is not the bottleneck.
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import ROOT, prepare_db, summarize, write_report
+
+API_DIR = os.path.join(ROOT, "src", "api")
+
+
+def _request(conn, method, path, body=None):
+    """One keep-alive request; raises unless the API answered 200"""
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload else {}
+    conn.request(method, path, body=payload, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    if response.status != 200:
+        raise RuntimeError(f"{method} {path} -> {response.status}")
+
+
+def _read_client(port, users, duration, threads, results):
+    """Client process: `threads` connections asking for random users' stats until the deadline"""
+    deadline = time.perf_counter() + duration
+    latencies = []
+    errors = []
+
+    def loop(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        mine, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                _request(conn, "GET", f"/users/{rng.randint(1, users)}/stats")
+            except (OSError, http.client.HTTPException, RuntimeError):
+                failed += 1
+                conn.close()
+                continue
+            mine.append(time.perf_counter() - start)
+        conn.close()
+        latencies.extend(mine)
+        errors.append(failed)
+
+    workers = [threading.Thread(target=loop, args=(os.getpid() * 1000 + i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    results.put((latencies, sum(errors)))
+
+
+def _write_client(port, users, rate, stop, counts):
+    """POST evaluations at `rate` per second until stopped; counts["ok"/"errors"]"""
+    rng = random.Random(0)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while not stop.wait(1 / rate):
+        body = {"from_user_id": rng.randint(1, users), "to_user_id": rng.randint(1, users),
+                "rating": rng.randint(1, 5), "comment": "bench", "task_type": "general"}
+        try:
+            _request(conn, "POST", "/evaluations", body)
+            counts["ok"] += 1
+        except (OSError, http.client.HTTPException, RuntimeError):
+            counts["errors"] += 1
+            conn.close()
+    conn.close()
+
+
+def _wait_for(check, what, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {what}")
+
+
+def _healthy(port):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+    try:
+        _request(conn, "GET", "/health")
+        return True
+    except (OSError, http.client.HTTPException, RuntimeError):
+        return False
+    finally:
+        conn.close()
+
+
+def start_deployment(workers, port, socket_dir):
+    """writer.py plus N uvicorn workers in writer mode; returns both processes"""
+    env = dict(os.environ,
+               ATN_WRITER_ADDRESS=os.path.join(socket_dir, "writer.sock"),
+               ATN_WRITER_AUTHKEY=secrets.token_hex(32),
+               ATN_SCHEDULER="0")
+    writer = subprocess.Popen([sys.executable, "writer.py"], cwd=API_DIR, env=env)
+    processes = [writer]
+    try:
+        _wait_for(lambda: os.path.exists(env["ATN_WRITER_ADDRESS"]), "writer.py")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+            cwd=API_DIR, env=env))
+        _wait_for(lambda: _healthy(port), f"{workers} uvicorn workers")
+    except BaseException:
+        stop_deployment(processes)
+        raise
+    return processes
+
+
+def stop_deployment(processes):
+    for process in reversed(processes):
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run(args, workers):
+    """Load one deployment; returns the summary for this worker count"""
+    socket_dir = tempfile.mkdtemp(prefix="atn-read-scaling-")
+    processes = start_deployment(workers, args.port, socket_dir)
+    try:
+        writes = {"ok": 0, "errors": 0}
+        stop = threading.Event()
+        write_thread = threading.Thread(target=_write_client,
+                                        args=(args.port, args.users, args.write_rate, stop, writes))
+        write_thread.start()
+
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=_read_client,
+                                           args=(args.port, args.users, args.duration, args.threads, results))
+                   for _ in range(args.clients)]
+        for p in clients:
+            p.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            mine, failed = results.get()
+            latencies.extend(mine)
+            errors += failed
+        for p in clients:
+            p.join()
+        stop.set()
+        write_thread.join()
+    finally:
+        stop_deployment(processes)
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+    summary = summarize(latencies, errors, args.duration, args.clients * args.threads)
+    summary.update(workers=workers, writes=writes["ok"], write_errors=writes["errors"])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="/tmp/atn-read-scaling.db")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--evaluations", type=int, default=100_000)
+    parser.add_argument("--reseed", action="store_true", help="rebuild the DB even if it exists")
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[n for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load per worker count")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--threads", type=int, default=16, help="keep-alive connections per client process")
+    parser.add_argument("--write-rate", type=float, default=50, help="POST /evaluations per second during reads")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+    if subprocess.run([sys.executable, "-c", "import uvicorn"], capture_output=True).returncode:
+        raise SystemExit("read_scaling.py needs uvicorn: pip install -r src/api/requirements.txt")
+
+    dataset = prepare_db(args)
+    results = {}
+    baseline = None
+    for workers in args.workers:
+        summary = run(args, workers)
+        baseline = baseline or summary["throughput_rps"]
+        summary["speedup"] = round(summary["throughput_rps"] / baseline, 2) if baseline else 0.0
+        results[f"GET /users/{{id}}/stats workers={workers}"] = summary
+        print(f"{workers} workers: {summary['throughput_rps']} req/s, p99 {summary['p99_ms']} ms",
+              file=sys.stderr)
+    write_report("read_scaling", dataset, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Search latency: FTS5 prefix queries, comment search and fuzzy /find
+
+    python benchmarks/search_bench.py --db /tmp/atn-search.db --users 1000000 --evaluations 1000000
+
+Queries run against the synthetic dataset from seed.py (FTS indexes are
+maintained by triggers while seeding) over a read-only connection.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+
+from common import ROOT, add_common_args, drive, prepare_db, write_report
+
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "src", "api"))
+
+from atn_common.search import fuzzy_find_users, search_evaluations, search_users  # noqa: E402
+from writer import connect_readonly  # noqa: E402
+
+
+async def run(args):
+    dataset = prepare_db(args)
+    conn = connect_readonly(args.db)
+    rng = random.Random(3)
+    user = lambda: rng.randint(1, args.users)  # noqa: E731
+
+    cases = {
+        "agents exact username": lambda: search_users(conn, f"agent_{user()}"),
+        "agents 2-char prefix": lambda: search_users(conn, "ag"),
+        "agents id prefix": lambda: search_users(conn, str(user())[:3]),
+        "evaluations comment": lambda: search_evaluations(conn, rng.choice(["great", "fast accurate", "code"])),
+        "evaluations prefix page 5": lambda: search_evaluations(conn, "re", 20, 80),
+        "fuzzy find typo": lambda: fuzzy_find_users(conn, f"agnet_{user()}"),
+    }
+    results = {}
+    for name, query in cases.items():
+        async def call(i, query=query):
+            query()
+
+        results[name] = await drive(call, args.requests, 1)
+    conn.close()
+    return write_report("search", dataset, results, args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_common_args(parser)
+    parser.set_defaults(db="/tmp/atn-search.db", requests=500)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Seed a synthetic ATN database for benchmarks
+
+    python benchmarks/seed.py --db /tmp/atn-bench.db --users 10000 --evaluations 100000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+sys.path.insert(0, os.path.join(SRC, "api"))
+
+from schema import init_schema  # noqa: E402
+
+TASK_TYPES = ["general", "analysis", "research", "development", "review"]
+COMMENTS = ["Great work", "Fast and accurate", "Solid analysis", "Needs improvement",
+            "Excellent research", "Reliable agent", "Late delivery", "Clean code"]
+
+
+def seed(db_path, users=10_000, evaluations=100_000, seed_value=42, chunk=50_000):
+    """Create the API schema in db_path and fill it with reproducible fake data"""
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    init_schema(conn)
+
+    start = datetime(2026, 1, 1)
+    conn.executemany(
+        "INSERT OR REPLACE INTO users (user_id, username, first_name, reputation_score, tasks_completed, "
+        "registered_at, last_active, is_agent) VALUES (?, ?, ?, 0, ?, ?, ?, ?)",
+        (
+            (uid, f"agent_{uid}", f"Agent {uid}", rng.randint(0, 200),
+             start.isoformat(), (start + timedelta(minutes=rng.randint(0, 400_000))).isoformat(),
+             int(rng.random() < 0.6))
+            for uid in range(1, users + 1)
+        ),
+    )
+
+    for offset in range(0, evaluations, chunk):
+        rows = []
+        for _ in range(min(chunk, evaluations - offset)):
+            ts = (start + timedelta(seconds=rng.randint(0, 20_000_000))).isoformat()
+            rows.append((rng.randint(1, users), rng.randint(1, users), rng.randint(1, 5),
+                         rng.choice(COMMENTS), rng.choice(TASK_TYPES), ts))
+        conn.executemany(
+            "INSERT INTO evaluations (from_user_id, to_user_id, rating, comment, task_type, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.executemany(
+            "INSERT INTO reputation_log (user_id, change, reason, timestamp) VALUES (?, ?, ?, ?)",
+            ((to_id, rating * 10, f"Evaluation: {task}", ts) for _, to_id, rating, _, task, ts in rows),
+        )
+        conn.commit()
+
+    conn.execute('''
+        UPDATE users SET reputation_score = COALESCE(
+            (SELECT SUM(change) FROM reputation_log WHERE reputation_log.user_id = users.user_id), 0)
+    ''')
+    # Scores above already include every log row
+    conn.execute("UPDATE reputation_compaction SET last_log_id = (SELECT COALESCE(MAX(id), 0) FROM reputation_log)")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", required=True)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--evaluations", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    seed(args.db, args.users, args.evaluations, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Write throughput vs. shard count
+
+Each writer process commits evaluations as fast as it can for --duration
+seconds, one commit per evaluation (as the API does in direct mode). With
+N shards every writer owns its own tenant file; the baseline runs the same
+number of writers against one shared file, where they queue on its single
+write lock.
+
+    python benchmarks/shard_bench.py --max-shards 8 --duration 5
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "api"))
+
+from atn_common.sharding import ShardRouter  # noqa: E402
+from schema import init_schema  # noqa: E402
+from writer import apply_evaluation, connect_writable  # noqa: E402
+
+
+def _writer(db_path, users, duration, counter):
+    conn = connect_writable(db_path)
+    rng = random.Random(os.getpid())
+    done = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        try:
+            apply_evaluation(conn, rng.randint(1, users), rng.randint(1, users), rng.randint(1, 5), "bench")
+            conn.commit()
+            done += 1
+        except sqlite3.OperationalError:
+            conn.rollback()  # database is locked: counts as lost throughput
+    with counter.get_lock():
+        counter.value += done
+
+
+def prepare(path, users):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    init_schema(conn)
+    conn.executemany("INSERT OR IGNORE INTO users (user_id, username, first_name, is_agent) VALUES (?, ?, ?, 1)",
+                     [(i, f"agent_{i}", f"Agent {i}") for i in range(1, users + 1)])
+    conn.commit()
+    conn.close()
+
+
+def run(paths, users, duration):
+    counter = multiprocessing.Value("q", 0)
+    writers = [multiprocessing.Process(target=_writer, args=(path, users, duration, counter)) for path in paths]
+    for p in writers:
+        p.start()
+    for p in writers:
+        p.join()
+    return counter.value / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", default="/tmp/atn-shard-bench")
+    parser.add_argument("--users", type=int, default=1_000, help="agents per shard")
+    parser.add_argument("--max-shards", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args()
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    router = ShardRouter(os.path.join(args.dir, "shards"))
+    shared = os.path.join(args.dir, "shared.db")
+    os.makedirs(args.dir)
+    prepare(shared, args.users)
+
+    counts = [n for n in (1, 2, 4, 8, 16, 32) if n <= args.max_shards]
+    results = {}
+    for n in counts:
+        paths = [router.path_for(f"bench{i}") for i in range(n)]
+        os.makedirs(router.shard_dir, exist_ok=True)
+        for path in paths:
+            prepare(path, args.users)
+        sharded = run(paths, args.users, args.duration)
+        single = run([shared] * n, args.users, args.duration)
+        results[f"{n} writers"] = {
+            "sharded_writes_per_s": round(sharded, 1),
+            "single_file_writes_per_s": round(single, 1),
+            "speedup": round(sharded / single, 2) if single else None,
+        }
+        print(f"{n:>3} writers: {sharded:9.1f} w/s sharded, {single:9.1f} w/s on one file", file=sys.stderr)
+
+    report = {"benchmark": "shard_writes", "cpu_count": os.cpu_count(), "users_per_shard": args.users,
+              "duration_s": args.duration, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""ATN analytics - reputation rollups and per-task-type facets
+
+reputation_rollup holds one row per (user, bucket, bucket_start) and is kept
+current by a trigger on reputation_log, so every write path (API, bot,
+writer process) maintains it without code changes and charts never have to
+scan the raw log. Rollups are not touched when old log rows are archived,
+and the nightly rebuild only recomputes buckets that are entirely live.
+
+reputation_facets holds one row per (task_type, user) with evaluation count,
+rating sum and score awarded, maintained by triggers on evaluations, so
+per-task leaderboards and stats breakdowns never GROUP BY over evaluations.
+Facet scores follow task_weights (see adjustments.py) like the awards do.
+"""
+
+import sqlite3
+
+from atn_common.adjustments import REWEIGHTING_SQL, TASK_KEY_SQL, award_sql
+
+BUCKETS = {"hour": 13, "day": 10}  # length of the ISO timestamp prefix per bucket
+
+
+def init_rollups(conn):
+    """Create the rollup table and trigger, backfilling from the live log on first run"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reputation_rollup'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reputation_rollup (
+            user_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0,
+            total_change INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, bucket, bucket_start)
+        ) WITHOUT ROWID
+    ''')
+    upserts = "\n".join(f'''
+            INSERT INTO reputation_rollup (user_id, bucket, bucket_start, events, total_change)
+            VALUES (NEW.user_id, '{bucket}', substr(NEW.timestamp, 1, {width}), 1, NEW.change)
+            ON CONFLICT (user_id, bucket, bucket_start)
+            DO UPDATE SET events = events + 1, total_change = total_change + excluded.total_change;'''
+        for bucket, width in BUCKETS.items())
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reputation_rollup AFTER INSERT ON reputation_log
+        BEGIN{upserts}
+        END
+    ''')
+    if not exists:
+        _backfill_rollups(conn)
+
+
+def _backfill_rollups(conn, after=None):
+    """Roll up live log events, or only those in buckets later than `after` (an ISO timestamp)"""
+    for bucket, width in BUCKETS.items():
+        since = after[:width] if after else ""
+        conn.execute(f'''
+            INSERT INTO reputation_rollup (user_id, bucket, bucket_start, events, total_change)
+            SELECT user_id, '{bucket}', substr(timestamp, 1, {width}), COUNT(*), SUM(change)
+            FROM reputation_log WHERE timestamp IS NOT NULL AND substr(timestamp, 1, {width}) > ?
+            GROUP BY user_id, substr(timestamp, 1, {width})
+        ''', (since,))
+
+
+def rebuild_rollups(conn):
+    """Recompute rollups from the live log, repairing drift; caller owns the transaction
+
+    Archived events are gone from reputation_log, so the bucket holding the
+    oldest live event and every bucket before it are kept as they are.
+    """
+    oldest = conn.execute("SELECT MIN(timestamp) FROM reputation_log").fetchone()[0]
+    if oldest is None:
+        return
+    for bucket, width in BUCKETS.items():
+        conn.execute("DELETE FROM reputation_rollup WHERE bucket = ? AND bucket_start > ?",
+                     (bucket, oldest[:width]))
+    _backfill_rollups(conn, oldest)
+
+
+def bucketed_history(conn, user_id, current_score, bucket="day", limit=30):
+    """Last `limit` buckets, oldest first, with the score at the end of each bucket
+
+    Scores are walked backwards from the user's current score, so any score
+    that predates the log (or was archived before rollups existed) is kept.
+    """
+    rows = conn.execute('''
+        SELECT bucket_start, events, total_change FROM reputation_rollup
+        WHERE user_id = ? AND bucket = ?
+        ORDER BY bucket_start DESC LIMIT ?
+    ''', (user_id, bucket, limit)).fetchall()
+
+    history = []
+    score = current_score
+    for bucket_start, events, total_change in rows:
+        history.append({"bucket_start": bucket_start, "events": events,
+                        "change": total_change, "score": score})
+        score -= total_change
+    history.reverse()
+    return history
+
+
+# ============ TASK-TYPE FACETS ============
+
+# Same normalisation in SQL (triggers) and Python (query params)
+FACET_KEY_SQL = TASK_KEY_SQL
+
+# Per-user aggregates over all task types; use inside a query on `users`
+AVG_RATING_SQL = '''(SELECT SUM(rating_sum) * 1.0 / SUM(evaluation_count) FROM reputation_facets
+    WHERE reputation_facets.user_id = users.user_id)'''
+EVAL_COUNT_SQL = '''(SELECT COALESCE(SUM(evaluation_count), 0) FROM reputation_facets
+    WHERE reputation_facets.user_id = users.user_id)'''
+
+
+def normalize_task_type(task_type):
+    return (task_type or "general").strip().lower()
+
+
+def _facet_delta_sql(row, sign):
+    """Upsert adding (sign = 1) or removing (sign = -1) one evaluation from its facet"""
+    key = FACET_KEY_SQL.format(col=f"{row}.task_type")
+    # Score mirrors writer.apply_evaluation: rating * 10 points times the task weight
+    return f'''
+            INSERT INTO reputation_facets (task_type, user_id, evaluation_count, rating_sum, score)
+            VALUES ({key}, {row}.to_user_id, {sign}, {sign} * {row}.rating, {sign} * {award_sql(f"{row}.rating", key)})
+            ON CONFLICT (task_type, user_id) DO UPDATE SET
+                evaluation_count = evaluation_count + excluded.evaluation_count,
+                rating_sum = rating_sum + excluded.rating_sum,
+                score = score + excluded.score;'''
+
+
+def init_facets(conn):
+    """Create the facet table and triggers, backfilling from evaluations on first run"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reputation_facets'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reputation_facets (
+            task_type TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            evaluation_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            score INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (task_type, user_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_facets_task_score ON reputation_facets(task_type, score DESC)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_facets_user ON reputation_facets(user_id)")
+
+    # Triggers from before task weights award a flat rating * 10
+    stale = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_facets_%' "
+        "AND sql NOT LIKE '%task_weights%'"
+    ).fetchall()
+    for (name,) in stale:
+        conn.execute(f"DROP TRIGGER {name}")
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_facets_insert AFTER INSERT ON evaluations
+        BEGIN{_facet_delta_sql("NEW", 1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_facets_delete AFTER DELETE ON evaluations
+        BEGIN{_facet_delta_sql("OLD", -1)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_facets_update AFTER UPDATE OF to_user_id, rating, task_type ON evaluations
+        BEGIN{_facet_delta_sql("OLD", -1)}{_facet_delta_sql("NEW", 1)}
+        END
+    ''')
+
+    if not exists:
+        _backfill_facets(conn)
+
+
+def _backfill_facets(conn, where="1"):
+    key = FACET_KEY_SQL.format(col="task_type")
+    weight_key = FACET_KEY_SQL.format(col="evaluations.task_type")
+    conn.execute(f'''
+        INSERT INTO reputation_facets (task_type, user_id, evaluation_count, rating_sum, score)
+        SELECT {key}, to_user_id, COUNT(*), SUM(rating), SUM({award_sql("evaluations.rating", weight_key)})
+        FROM evaluations WHERE {where} GROUP BY {key}, to_user_id
+    ''')
+
+
+def rebuild_facets(conn):
+    """Recompute facets from evaluations, repairing drift; caller owns the transaction
+
+    Task types with an unfinished reweight job are left alone: the job works
+    out each user's score delta from the facet score awarded so far, and a
+    rebuild at the new weight would zero those deltas.
+    """
+    conn.execute(f"DELETE FROM reputation_facets WHERE task_type NOT IN ({REWEIGHTING_SQL})")
+    _backfill_facets(conn, f"{FACET_KEY_SQL.format(col='task_type')} NOT IN ({REWEIGHTING_SQL})")
+
+
+def rebuild_aggregates(db_path):
+    """Scheduler job: rebuild_rollups and rebuild_facets in one transaction"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rebuild_rollups(conn)
+        rebuild_facets(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def task_breakdown(conn, user_id):
+    """Per-task-type facets for one user, highest score first"""
+    rows = conn.execute('''
+        SELECT task_type, evaluation_count, rating_sum, score FROM reputation_facets
+        WHERE user_id = ? AND evaluation_count > 0
+        ORDER BY score DESC
+    ''', (user_id,)).fetchall()
+    return [
+        {
+            "task_type": task_type,
+            "evaluation_count": count,
+            "avg_rating": round(rating_sum / count, 2),
+            "score": score
+        }
+        for task_type, count, rating_sum, score in rows
+    ]
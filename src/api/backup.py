@@ -0,0 +1,292 @@
+"""ATN backup - online compressed snapshots and fast restore
+
+    python backup.py snapshot --keep 7
+    python backup.py list
+    python backup.py restore                             # newest snapshot
+    python backup.py restore --at 2026-10-18T23:00:00    # newest taken at or before
+    python backup.py restore --name atn-20261018T230000.123456.db.gz --check
+
+`snapshot` copies the live DB with the online backup API, ATN_BACKUP_PAGES
+pages per step with an ATN_BACKUP_PAUSE sleep between steps. The copy runs
+inside one read transaction, so it is a consistent point-in-time image of the
+moment it started. In WAL mode a reader never blocks writers, and pinning the
+snapshot also stops the copy from restarting every time a writer commits. The
+copy is then compressed next to a JSON manifest that holds the SHA-256 of the
+uncompressed file. Compression uses zstd when the optional zstandard package
+is installed and gzip otherwise.
+
+`restore` streams the snapshot back in large blocks, checking the hash as it
+goes, and swaps it in with one rename. It does not replay anything page by
+page. The file it replaces is kept as <db>.pre-restore. Stop the API, the
+writer and the bot before restoring.
+
+With ATN_SHARD_DIR set, `snapshot` covers every shard and snapshots are named
+after each shard file. Names carry the time down to the microsecond, and a
+snapshot never replaces an existing file of the same name.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+# src/ holds the atn_common package shared with the bot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.sharding import SHARD_DIR, ShardRouter  # noqa: E402
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DB_PATH = os.getenv("DATABASE_URL", "sqlite:///atn.db").replace("sqlite:///", "")
+BACKUP_DIR = os.getenv("ATN_BACKUP_DIR", "backups")
+BACKUP_PAGES = int(os.getenv("ATN_BACKUP_PAGES", "1024"))
+BACKUP_PAUSE = float(os.getenv("ATN_BACKUP_PAUSE", "0.005"))
+BACKUP_KEEP = int(os.getenv("ATN_BACKUP_KEEP", "7"))
+BACKUP_CRON = os.getenv("ATN_BACKUP_CRON", "")  # run by the API (or writer) scheduler when set
+
+BLOCK_SIZE = 16 * 1024 * 1024
+CODECS = ("zst", "gz")
+
+
+def default_codec():
+    return "zst" if zstandard else "gz"
+
+
+def _open_compressed(path, mode):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path} needs the zstandard package")
+        if mode == "wb":
+            return zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(open(path, "wb"), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return gzip.open(path, mode, compresslevel=1)
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _stem(db_path):
+    name = os.path.basename(db_path)
+    return name[:-len(".db")] if name.endswith(".db") else name
+
+
+def databases():
+    """Every database this deployment keeps: each shard, or the single DB"""
+    if SHARD_DIR:
+        router = ShardRouter(SHARD_DIR)
+        return [router.path_for(tenant) for tenant in router.tenants()]
+    return [DB_PATH]
+
+
+# ============ SNAPSHOT ============
+
+def copy_online(db_path, dest_path, pages=BACKUP_PAGES, pause=BACKUP_PAUSE):
+    """Backup-API copy of db_path as of one read snapshot; returns (taken_at, last_log_id, users)"""
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30, isolation_level=None)
+    dst = sqlite3.connect(dest_path)
+    try:
+        # Pin one WAL snapshot for the whole copy; backup steps reuse this transaction
+        src.execute("BEGIN")
+        taken_at = datetime.now().isoformat(timespec="seconds")
+        last_log_id = src.execute("SELECT COALESCE(MAX(id), 0) FROM reputation_log").fetchone()[0]
+        users = src.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        src.backup(dst, pages=pages, progress=lambda status, remaining, total: pause and time.sleep(pause))
+        src.execute("COMMIT")
+        # Self-contained file: no -wal sidecar needed to open it
+        dst.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        src.close()
+        dst.close()
+    return taken_at, last_log_id, users
+
+
+def create_snapshot(db_path=DB_PATH, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, codec=None):
+    """Write a compressed snapshot of db_path plus its manifest; returns the manifest"""
+    codec = codec or default_codec()
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+    name = f"{_stem(db_path)}-{stamp}.db.{codec}"
+    final_path = os.path.join(backup_dir, name)
+    raw_path = os.path.join(backup_dir, f".{name}.raw")
+    tmp_path = os.path.join(backup_dir, f".{name}.tmp")
+    # Claim the name first: a second snapshot with the same name fails instead of replacing this one
+    os.close(os.open(final_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+    try:
+        taken_at, last_log_id, users = copy_online(db_path, raw_path, pages, pause)
+        copied = time.perf_counter()
+
+        digest = hashlib.sha256()
+        with open(raw_path, "rb") as src, _open_compressed(tmp_path, "wb") as dst:
+            while block := src.read(BLOCK_SIZE):
+                digest.update(block)
+                dst.write(block)
+        _fsync(tmp_path)
+        os.replace(tmp_path, final_path)
+
+        manifest = {
+            "name": name,
+            "source": os.path.abspath(db_path),
+            "taken_at": taken_at,
+            "size": os.path.getsize(raw_path),
+            "compressed_size": os.path.getsize(final_path),
+            "sha256": digest.hexdigest(),
+            "last_log_id": last_log_id,
+            "users": users,
+            "copy_seconds": round(copied - started, 3),
+            "compress_seconds": round(time.perf_counter() - copied, 3),
+        }
+        with open(final_path + ".json", "x") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+    except BaseException:
+        os.remove(final_path)
+        raise
+    finally:
+        for path in (raw_path, tmp_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def list_snapshots(backup_dir=BACKUP_DIR, db_path=None):
+    """Manifests in backup_dir, newest first; only db_path's snapshots when given"""
+    if not os.path.isdir(backup_dir):
+        return []
+    manifests = []
+    for entry in os.listdir(backup_dir):
+        if not entry.endswith(".json") or entry.startswith("."):
+            continue
+        with open(os.path.join(backup_dir, entry)) as f:
+            manifest = json.load(f)
+        if db_path is None or manifest["name"].startswith(_stem(db_path) + "-"):
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda m: (m["taken_at"], m["name"]), reverse=True)
+
+
+def prune_snapshots(db_path=DB_PATH, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` snapshots of db_path; returns how many went"""
+    stale = list_snapshots(backup_dir, db_path)[keep:]
+    for manifest in stale:
+        os.remove(os.path.join(backup_dir, manifest["name"]))
+        os.remove(os.path.join(backup_dir, manifest["name"] + ".json"))
+    return len(stale)
+
+
+def backup_job(db_path):
+    """Scheduler job: snapshot one DB and apply retention"""
+    create_snapshot(db_path)
+    prune_snapshots(db_path)
+
+
+# ============ RESTORE ============
+
+def find_snapshot(db_path=DB_PATH, backup_dir=BACKUP_DIR, at=None, name=None):
+    """Snapshot by name, else the newest one taken at or before `at` (ISO time)"""
+    for manifest in list_snapshots(backup_dir, None if name else db_path):
+        if name is not None:
+            if manifest["name"] == name:
+                return manifest
+        elif at is None or manifest["taken_at"] <= at:
+            return manifest
+    raise LookupError("No matching snapshot")
+
+
+def restore_snapshot(manifest, db_path=DB_PATH, backup_dir=BACKUP_DIR, check=False):
+    """Replace db_path with the snapshot; the old file is kept as <db_path>.pre-restore"""
+    tmp_path = db_path + ".restore"
+    digest = hashlib.sha256()
+    try:
+        with _open_compressed(os.path.join(backup_dir, manifest["name"]), "rb") as src, open(tmp_path, "wb") as dst:
+            while block := src.read(BLOCK_SIZE):
+                digest.update(block)
+                dst.write(block)
+        if digest.hexdigest() != manifest["sha256"]:
+            raise RuntimeError(f"Checksum mismatch restoring {manifest['name']}")
+        if check:
+            conn = sqlite3.connect(tmp_path)
+            try:
+                result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                conn.close()
+            if result != "ok":
+                raise RuntimeError(f"quick_check failed on {manifest['name']}: {result}")
+        _fsync(tmp_path)
+
+        if os.path.exists(db_path):
+            # Fold any WAL into the old file so .pre-restore is complete on its own
+            conn = sqlite3.connect(db_path)
+            try:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                conn.close()
+            os.replace(db_path, db_path + ".pre-restore")
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(tmp_path, db_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# ============ CLI ============
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot and restore ATN databases")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    snap = sub.add_parser("snapshot", help="online compressed snapshot")
+    snap.add_argument("--db", action="append", help="database to snapshot (default: every database)")
+    snap.add_argument("--pages", type=int, default=BACKUP_PAGES, help="pages copied per step (-1 = all)")
+    snap.add_argument("--pause", type=float, default=BACKUP_PAUSE, help="seconds to sleep between steps")
+    snap.add_argument("--codec", choices=CODECS)
+    snap.add_argument("--keep", type=int, help="then delete all but this many snapshots per database")
+
+    sub.add_parser("list", help="snapshots, newest first")
+
+    restore = sub.add_parser("restore", help="replace a database with a snapshot")
+    restore.add_argument("--db", default=DB_PATH)
+    which = restore.add_mutually_exclusive_group()
+    which.add_argument("--at", help="newest snapshot taken at or before this ISO time")
+    which.add_argument("--name", help="exact snapshot file name")
+    restore.add_argument("--check", action="store_true", help="run PRAGMA quick_check before swapping in")
+
+    args = parser.parse_args()
+    if args.command == "snapshot":
+        for db_path in args.db or databases():
+            manifest = create_snapshot(db_path, args.dir, args.pages, args.pause, args.codec)
+            print(f"{manifest['name']}: {manifest['size']} -> {manifest['compressed_size']} bytes "
+                  f"in {manifest['copy_seconds'] + manifest['compress_seconds']:.1f}s", file=sys.stderr)
+            if args.keep is not None:
+                prune_snapshots(db_path, args.dir, args.keep)
+    elif args.command == "list":
+        for manifest in list_snapshots(args.dir):
+            print(f"{manifest['name']}\t{manifest['taken_at']}\t{manifest['users']} users\t"
+                  f"{manifest['compressed_size']} bytes")
+    else:
+        try:
+            manifest = find_snapshot(args.db, args.dir, args.at, args.name)
+        except LookupError as e:
+            raise SystemExit(str(e))
+        started = time.perf_counter()
+        restore_snapshot(manifest, args.db, args.dir, args.check)
+        print(f"Restored {manifest['name']} (taken {manifest['taken_at']}) into {args.db} "
+              f"in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""ATN export - stream evaluations / reputation_log to Parquet or Arrow
+
+    python export.py evaluations --format parquet --out evaluations.parquet
+    python export.py reputation_log --format arrow --out log.arrow --include-archive
+    python export.py reputation_log --since-id 120000 --format arrow-stream --out - | analytics-job
+
+Rows are read over a read-only connection in keyset-paginated chunks
+(WHERE id > ? ORDER BY id LIMIT ?), so memory stays flat and the live DB only
+ever sees short indexed range scans. The last exported id is printed on
+stderr; pass it back as --since-id for incremental exports.
+
+Requires pyarrow, which is an optional dependency of the API.
+"""
+
+import argparse
+import os
+import sys
+
+# src/ holds the atn_common package shared with the bot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.eventlog import archive_dir_for, list_segments, load_segment  # noqa: E402
+
+from writer import DB_PATH, connect_readonly  # noqa: E402
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+TABLE_COLUMNS = {
+    "evaluations": [("id", "int64"), ("from_user_id", "int64"), ("to_user_id", "int64"), ("rating", "int8"),
+                    ("comment", "string"), ("task_type", "string"), ("created_at", "string")],
+    "reputation_log": [("id", "int64"), ("user_id", "int64"), ("change", "int64"), ("reason", "string"),
+                       ("timestamp", "string")],
+}
+FORMATS = ("parquet", "arrow", "arrow-stream")
+
+
+def arrow_schema(table):
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in TABLE_COLUMNS[table]])
+
+
+def iter_live_chunks(conn, table, since_id=0, chunk_rows=50_000):
+    """Yield column dicts of up to chunk_rows rows with id > since_id, in id order"""
+    names = [name for name, _ in TABLE_COLUMNS[table]]
+    last_id = since_id
+    while True:
+        rows = conn.execute(
+            f"SELECT {', '.join(names)} FROM {table} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_rows)
+        ).fetchall()
+        if not rows:
+            return
+        yield {name: [row[i] for row in rows] for i, name in enumerate(names)}
+        last_id = rows[-1][0]
+
+
+def iter_archive_chunks(archive_dir, since_id=0):
+    """Yield archived reputation_log segments (already columnar), oldest first"""
+    for first_id, last_id, path in reversed(list_segments(archive_dir)):
+        if last_id <= since_id:
+            continue
+        columns = load_segment(path)
+        if first_id <= since_id:
+            keep = [i for i, row_id in enumerate(columns["id"]) if row_id > since_id]
+            columns = {name: [values[i] for i in keep] for name, values in columns.items()}
+        yield columns
+
+
+def export(table, out, fmt="parquet", since_id=0, chunk_rows=50_000, include_archive=False, db_path=DB_PATH):
+    """Stream one table into a Parquet/Arrow file; returns (rows, last_id)"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for exports: pip install pyarrow")
+
+    schema = arrow_schema(table)
+    sink = sys.stdout.buffer if out == "-" else out
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+        write = lambda batch: writer.write_table(pa.Table.from_batches([batch]))  # noqa: E731
+    elif fmt == "arrow":
+        writer = pa.ipc.new_file(sink, schema)
+        write = writer.write_batch
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+
+    rows = 0
+    last_id = since_id
+    conn = connect_readonly(db_path)
+    try:
+        if include_archive and table == "reputation_log":
+            for columns in iter_archive_chunks(archive_dir_for(db_path), since_id):
+                write(pa.RecordBatch.from_pydict(columns, schema=schema))
+                rows += len(columns["id"])
+                last_id = max(last_id, columns["id"][-1])
+        # Live rows after the archives; skips ids an interrupted archive run left in both
+        for columns in iter_live_chunks(conn, table, last_id, chunk_rows):
+            write(pa.RecordBatch.from_pydict(columns, schema=schema))
+            rows += len(columns["id"])
+            last_id = columns["id"][-1]
+    finally:
+        conn.close()
+        writer.close()
+    return rows, last_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export ATN tables to Parquet/Arrow")
+    parser.add_argument("table", choices=sorted(TABLE_COLUMNS))
+    parser.add_argument("--out", required=True, help="output file, or - for stdout")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--since-id", type=int, default=0, help="only rows with a larger id")
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    parser.add_argument("--include-archive", action="store_true",
+                        help="also export archived reputation_log segments")
+    args = parser.parse_args()
+
+    if args.out != "-" and os.path.dirname(args.out):
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    rows, last_id = export(args.table, args.out, args.format, args.since_id, args.chunk_rows, args.include_archive)
+    print(f"Exported {rows} rows from {args.table}, last id {last_id}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
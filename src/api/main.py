@@ -1,70 +1,126 @@
 """ATN API - Complete API with evaluation system"""
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from contextlib import asynccontextmanager
 import sqlite3
+import asyncio
+import hmac
+import json
 import os
-from datetime import datetime
+import sys
+import time
+
+# src/ holds the atn_common package shared with the bot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.adjustments import MAX_TASK_WEIGHT, create_job, get_job, list_jobs, resume_job  # noqa: E402
+from atn_common.eventlog import LIVE_SCORE_SQL, LIVE_TOP_CTE, compactor_loop  # noqa: E402
+from atn_common.idempotency import MAX_KEY_LENGTH, DuplicateRequest, RecentKeys, lookup_key  # noqa: E402
+from atn_common.maintenance import (AGGREGATE_REBUILD_CRON, JOB_JITTER, for_each_db,  # noqa: E402
+                                    register_maintenance_jobs)
+from atn_common.metrics import (METRICS_ENABLED, Histogram, db_factory, render_metrics,  # noqa: E402
+                                start_metrics_flusher)
+from atn_common.profiling import (PROFILE_HEADER, PROFILE_TOKEN, PROFILING_ENABLED, StackSampler,  # noqa: E402
+                                  should_sample)
+from atn_common.scheduler import SCHEDULER_ENABLED, Cron, Scheduler  # noqa: E402
+from atn_common.search import search_evaluations, search_users  # noqa: E402
+from atn_common.sharding import (DEFAULT_TENANT, SHARD_DIR, ShardRouter, compact_shards_loop,  # noqa: E402
+                                 iter_pages, merge_ranked)
+from atn_common.writer_client import WRITER_ADDRESS, WriterClient  # noqa: E402
+
+from analytics import (AVG_RATING_SQL, EVAL_COUNT_SQL, bucketed_history, normalize_task_type,  # noqa: E402
+                       rebuild_aggregates, task_breakdown)
+from backup import BACKUP_CRON, backup_job  # noqa: E402
+from push import PUSH_LEADERBOARD_SIZE, BroadcasterPool  # noqa: E402
+from schema import init_schema  # noqa: E402
+from writer import apply_evaluation, connect_readonly  # noqa: E402
 
 DB_PATH = os.getenv("DATABASE_URL", "sqlite:///atn.db").replace("sqlite:///", "")
+BATCH_STATS_MAX = int(os.getenv("ATN_BATCH_STATS_MAX", "500"))
+# Empty = /admin endpoints disabled
+ADMIN_TOKEN = os.getenv("ATN_ADMIN_TOKEN", "")
+
+# In writer mode this worker is read-only and forwards writes to writer.py
+writer_client = WriterClient() if WRITER_ADDRESS else None
+
+# Sharded mode: one DB file per tenant, picked by the X-ATN-Tenant header
+shard_router = ShardRouter(init=init_schema) if SHARD_DIR else None
+if shard_router and writer_client:
+    raise RuntimeError("ATN_SHARD_DIR and ATN_WRITER_ADDRESS cannot be combined")
+
+# Results of recent keyed writes, so most retries never reach SQLite
+recent_requests = RecentKeys("idempotency")
+
+def tenant_db_path(request: Request):
+    if not shard_router:
+        return DB_PATH
+    tenant = request.headers.get("x-atn-tenant") or request.query_params.get("tenant") or DEFAULT_TENANT
+    # Never create a shard for a caller-supplied id; the bot and reshard.py make them
+    try:
+        return shard_router.existing(tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+def get_db(request: Request):
+    db_path = tenant_db_path(request)
+    if writer_client:
+        conn = connect_readonly(db_path)
+    else:
+        # Sync dependencies are opened in the threadpool but used on the event loop
+        conn = sqlite3.connect(db_path, check_same_thread=False, factory=db_factory)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
     finally:
         conn.close()
 
+def maintained_db_paths():
+    if shard_router:
+        return [shard_router.ensure(tenant) for tenant in shard_router.tenants()]
+    return [DB_PATH]
+
+# Maintenance jobs; read-only workers in writer mode leave them to writer.py
+scheduler = None
+if SCHEDULER_ENABLED and not writer_client:
+    scheduler = Scheduler(shard_router.path_for(DEFAULT_TENANT) if shard_router else DB_PATH)
+    register_maintenance_jobs(scheduler, maintained_db_paths)
+    scheduler.add("rebuild_aggregates", for_each_db(rebuild_aggregates, maintained_db_paths),
+                  Cron(AGGREGATE_REBUILD_CRON), JOB_JITTER)
+    if BACKUP_CRON:
+        scheduler.add("backup", for_each_db(backup_job, maintained_db_paths), Cron(BACKUP_CRON), JOB_JITTER,
+                      lease_seconds=6 * 3600)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            reputation_score INTEGER DEFAULT 0,
-            tasks_completed INTEGER DEFAULT 0,
-            registered_at TEXT,
-            last_active TEXT,
-            is_agent INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # Reputation log
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reputation_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            change INTEGER,
-            reason TEXT,
-            timestamp TEXT
-        )
-    ''')
-    
-    # Evaluations/Feedback table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS evaluations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            from_user_id INTEGER,
-            to_user_id INTEGER,
-            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-            comment TEXT,
-            task_type TEXT,
-            created_at TEXT
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    # Lets /metrics on any worker report every worker (ATN_METRICS_DIR)
+    start_metrics_flusher()
+    # In writer mode the writer process owns compaction
+    if shard_router:
+        shard_router.ensure(DEFAULT_TENANT)
+        compactor = asyncio.create_task(compact_shards_loop(shard_router))
+    else:
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        # WAL lets readers keep serving from a snapshot while a write is in flight
+        conn.execute("PRAGMA journal_mode=WAL")
+        init_schema(conn)
+        conn.commit()
+        conn.close()
+        compactor = None if writer_client else asyncio.create_task(compactor_loop(DB_PATH))
+    if scheduler:
+        scheduler.start()
     yield
+    if scheduler:
+        await scheduler.stop()
+    await broadcasters.stop()
+    if compactor:
+        compactor.cancel()
 
 app = FastAPI(
     title="Agent Trust Network API",
@@ -75,6 +131,42 @@ app = FastAPI(
 
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
+REQUEST_DURATION = Histogram("atn_http_request_duration_seconds", "API request latency by route",
+                             ("method", "route", "status"))
+
+async def record_request_metrics(request: Request, call_next):
+    """Time every request, labelled by route template rather than raw path"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        REQUEST_DURATION.observe(time.perf_counter() - start, request.method, route, status)
+
+# Not registered at all when disabled, so there is no per-request cost
+if METRICS_ENABLED:
+    app.middleware("http")(record_request_metrics)
+
+async def profile_requests(request: Request, call_next):
+    """Sample-profile 1 in ATN_PROFILE_EVERY requests, or any carrying the debug header"""
+    header = request.headers.get(PROFILE_HEADER)
+    forced = bool(header and PROFILE_TOKEN and hmac.compare_digest(header, PROFILE_TOKEN))
+    if not (forced or should_sample()):
+        return await call_next(request)
+    
+    sampler = StackSampler().start()
+    try:
+        return await call_next(request)
+    finally:
+        route = getattr(request.scope.get("route"), "path", request.url.path)
+        sampler.stop(f"{request.method} {route}")
+
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_requests)
+
 # Models
 class AgentCreate(BaseModel):
     telegram_id: str
@@ -86,6 +178,7 @@ class EvaluationCreate(BaseModel):
     rating: int
     comment: Optional[str] = None
     task_type: str = "general"
+    idempotency_key: Optional[str] = Field(default=None, max_length=MAX_KEY_LENGTH)
 
 class EvaluationResponse(BaseModel):
     id: int
@@ -96,6 +189,12 @@ class EvaluationResponse(BaseModel):
     task_type: str
     created_at: str
 
+class TaskFacet(BaseModel):
+    task_type: str
+    evaluation_count: int
+    avg_rating: float
+    score: int
+
 class UserResponse(BaseModel):
     user_id: int
     username: Optional[str]
@@ -104,36 +203,57 @@ class UserResponse(BaseModel):
     tasks_completed: int
     avg_rating: float
     evaluation_count: int
+    task_breakdown: List[TaskFacet] = []
+
+class StatsBatchRequest(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=BATCH_STATS_MAX)
+
+class AdjustmentCreate(BaseModel):
+    kind: str = Field(pattern="^(revoke_evaluations|reweight_task_type)$")
+    from_user_id: Optional[int] = None
+    task_type: Optional[str] = Field(default=None, max_length=50)
+    weight: Optional[float] = Field(default=None, ge=0, le=MAX_TASK_WEIGHT)
+    requested_by: Optional[str] = Field(default=None, max_length=100)
 
 # ============ EVALUATION ENDPOINTS ============
 
 @app.post("/evaluations", response_model=dict)
-async def create_evaluation(data: EvaluationCreate, db: sqlite3.Connection = Depends(get_db)):
-    """Submit an evaluation for an agent"""
-    # Verify target user exists
-    cursor = db.execute("SELECT user_id, reputation_score FROM users WHERE user_id = ?", (data.to_user_id,))
-    user = cursor.fetchone()
-    if not user:
-        raise HTTPException(status_code=404, detail="Target user not found")
-    
-    # Insert evaluation
-    cursor.execute('''
-        INSERT INTO evaluations (from_user_id, to_user_id, rating, comment, task_type, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (data.from_user_id, data.to_user_id, data.rating, data.comment, data.task_type, datetime.now().isoformat()))
-    
-    # Update reputation (rating * 10 points)
-    score_change = data.rating * 10
-    cursor.execute("UPDATE users SET reputation_score = reputation_score + ? WHERE user_id = ?", 
-                   (score_change, data.to_user_id))
+async def create_evaluation(
+    data: EvaluationCreate,
+    db: sqlite3.Connection = Depends(get_db),
+    idempotency_key: Optional[str] = Header(default=None, max_length=MAX_KEY_LENGTH)
+):
+    """Submit an evaluation for an agent
     
-    # Log reputation change
-    cursor.execute("INSERT INTO reputation_log (user_id, change, reason, timestamp) VALUES (?, ?, ?, ?)",
-                   (data.to_user_id, score_change, f"Evaluation: {data.task_type}", datetime.now().isoformat()))
+    Retries carrying the same Idempotency-Key header (or idempotency_key
+    field) get the first result back with "duplicate": true.
+    """
+    fields = data.model_dump(exclude={"idempotency_key"})
+    key = idempotency_key or data.idempotency_key
+    if key:
+        # Keys are per evaluator so two clients can never collide
+        key = f"evaluation:{data.from_user_id}:{key}"
+        replay = recent_requests.get(key)
+        if replay is None and recent_requests.maybe_evicted(key):
+            replay = lookup_key(db, key)
+        if replay is not None:
+            return {**replay, "duplicate": True}
     
-    db.commit()
+    try:
+        if writer_client:
+            result = await run_in_threadpool(writer_client.submit, "create_evaluation", **fields, idempotency_key=key)
+        else:
+            result = apply_evaluation(db, **fields, idempotency_key=key)
+            db.commit()
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Target user not found")
+    except DuplicateRequest as e:
+        recent_requests.add(key, e.result)
+        return {**e.result, "duplicate": True}
     
-    return {"status": "success", "rating": data.rating, "score_awarded": score_change}
+    if key:
+        recent_requests.add(key, result)
+    return result
 
 @app.get("/evaluations/{user_id}", response_model=List[dict])
 async def get_user_evaluations(user_id: int, db: sqlite3.Connection = Depends(get_db)):
@@ -163,12 +283,11 @@ async def get_user_evaluations(user_id: int, db: sqlite3.Connection = Depends(ge
 @app.get("/users/{user_id}/stats", response_model=UserResponse)
 async def get_user_stats(user_id: int, db: sqlite3.Connection = Depends(get_db)):
     """Get user stats including ratings"""
-    cursor = db.execute('''
-        SELECT user_id, username, first_name, reputation_score, tasks_completed,
-               (SELECT AVG(rating) FROM evaluations WHERE to_user_id = ?),
-               (SELECT COUNT(*) FROM evaluations WHERE to_user_id = ?)
+    cursor = db.execute(f'''
+        SELECT user_id, username, first_name, {LIVE_SCORE_SQL}, tasks_completed,
+               {AVG_RATING_SQL}, {EVAL_COUNT_SQL}
         FROM users WHERE user_id = ?
-    ''', (user_id, user_id, user_id))
+    ''', (user_id,))
     
     row = cursor.fetchone()
     if not row:
@@ -181,19 +300,154 @@ async def get_user_stats(user_id: int, db: sqlite3.Connection = Depends(get_db))
         "reputation_score": row[3],
         "tasks_completed": row[4],
         "avg_rating": round(row[5] or 0, 2),
-        "evaluation_count": row[6]
+        "evaluation_count": row[6],
+        "task_breakdown": task_breakdown(db, user_id)
+    }
+
+@app.post("/users/stats:batch")
+async def get_users_stats_batch(data: StatsBatchRequest, db: sqlite3.Connection = Depends(get_db)):
+    """Stats for many users in one query, in request order
+    
+    Entries line up with user_ids; unknown ids get null and are listed in "missing".
+    """
+    # json_each keeps the whole id list in one bound parameter along with its position
+    cursor = db.execute(f'''
+        WITH wanted(pos, user_id) AS (SELECT key, value FROM json_each(?)),
+        found AS MATERIALIZED (
+            SELECT wanted.pos, users.user_id, username, first_name, {LIVE_SCORE_SQL} AS score, tasks_completed
+            FROM wanted JOIN users ON users.user_id = wanted.user_id
+        )
+        SELECT found.pos, found.user_id, username, first_name, found.score, tasks_completed,
+               f.task_type, f.evaluation_count, f.rating_sum, f.score
+        FROM found
+        LEFT JOIN reputation_facets f ON f.user_id = found.user_id AND f.evaluation_count > 0
+        ORDER BY found.pos, f.score DESC
+    ''', (json.dumps(data.user_ids),))
+    
+    users = [None] * len(data.user_ids)
+    for row in cursor:
+        entry = users[row[0]]
+        if entry is None:
+            entry = users[row[0]] = {
+                "user_id": row[1],
+                "username": row[2],
+                "first_name": row[3],
+                "reputation_score": row[4],
+                "tasks_completed": row[5],
+                "avg_rating": 0,
+                "evaluation_count": 0,
+                "task_breakdown": []
+            }
+        if row[6] is not None:
+            entry["task_breakdown"].append({
+                "task_type": row[6],
+                "evaluation_count": row[7],
+                "avg_rating": round(row[8] / row[7], 2),
+                "score": row[9]
+            })
+            entry["evaluation_count"] += row[7]
+            entry["avg_rating"] += row[8]
+    
+    for entry in users:
+        if entry and entry["evaluation_count"]:
+            entry["avg_rating"] = round(entry["avg_rating"] / entry["evaluation_count"], 2)
+    return {
+        "users": users,
+        "missing": [uid for uid, entry in zip(data.user_ids, users) if entry is None]
+    }
+
+@app.get("/users/{user_id}/history")
+async def get_user_history(
+    user_id: int,
+    db: sqlite3.Connection = Depends(get_db),
+    bucket: str = Query(default="day", pattern="^(hour|day)$"),
+    limit: int = Query(default=30, ge=1, le=1000)
+):
+    """Get reputation over time from the hourly/daily rollups"""
+    row = db.execute(f"SELECT {LIVE_SCORE_SQL} FROM users WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return {
+        "user_id": user_id,
+        "bucket": bucket,
+        "history": bucketed_history(db, user_id, row[0], bucket, limit)
     }
 
 @app.get("/leaderboard")
-async def get_leaderboard(db: sqlite3.Connection = Depends(get_db), limit: int = Query(default=20, le=100)):
-    """Get top agents by reputation"""
-    cursor = db.execute('''
-        SELECT user_id, username, first_name, reputation_score, tasks_completed,
-               (SELECT AVG(rating) FROM evaluations WHERE to_user_id = users.user_id) as avg_rating
-        FROM users ORDER BY reputation_score DESC LIMIT ?
-    ''', (limit,))
+async def get_leaderboard(
+    db: sqlite3.Connection = Depends(get_db),
+    limit: int = Query(default=20, le=100),
+    task_type: Optional[str] = Query(default=None, max_length=50)
+):
+    """Get top agents by reputation, or by score within one task type"""
+    if task_type:
+        return get_task_leaderboard(db, normalize_task_type(task_type), limit)
+    
+    return {
+        "leaderboard": [{"rank": i + 1, **entry} for i, entry in enumerate(query_leaderboard(db, limit))]
+    }
+
+def query_leaderboard(db: sqlite3.Connection, limit: int, offset: int = 0):
+    """Top agents by live score; shared by /leaderboard, the live stream and shard merges"""
+    cursor = db.execute(f'''
+        WITH {LIVE_TOP_CTE}
+        SELECT user_id, username, first_name, live_score, tasks_completed,
+               {AVG_RATING_SQL} as avg_rating
+        FROM live_top AS users ORDER BY live_score DESC LIMIT :limit OFFSET :offset
+    ''', {"top": limit + offset, "limit": limit, "offset": offset})
+    
+    return [
+        {
+            "user_id": row[0],
+            "username": row[1] or row[2],
+            "first_name": row[2],
+            "reputation_score": row[3],
+            "tasks_completed": row[4],
+            "avg_rating": round(row[5] or 0, 2)
+        }
+        for row in cursor.fetchall()
+    ]
+
+@app.get("/leaderboard/global")
+async def get_global_leaderboard(limit: int = Query(default=20, le=100)):
+    """Top agents across every tenant shard (same as /leaderboard when unsharded)"""
+    return {"leaderboard": await run_in_threadpool(global_leaderboard, limit)}
+
+def global_leaderboard(limit: int):
+    """k-way merge of every shard's leaderboard; each agent appears once, at its best score"""
+    if not shard_router:
+        tenants = [(DEFAULT_TENANT, DB_PATH)]
+    else:
+        tenants = [(tenant, shard_router.ensure(tenant)) for tenant in shard_router.tenants()]
+    
+    conns = [connect_readonly(path) for _, path in tenants]
+    try:
+        streams = [shard_leaderboard(conn, tenant, limit) for (tenant, _), conn in zip(tenants, conns)]
+        top = merge_ranked(streams, limit, key=lambda entry: entry["reputation_score"],
+                           distinct=lambda entry: entry["user_id"])
+    finally:
+        for conn in conns:
+            conn.close()
+    return [{"rank": i + 1, **entry} for i, entry in enumerate(top)]
+
+def shard_leaderboard(conn: sqlite3.Connection, tenant: str, page_size: int):
+    """One shard's leaderboard as a lazy stream, tagged with its tenant"""
+    for entry in iter_pages(lambda limit, offset: query_leaderboard(conn, limit, offset), page_size):
+        yield {"tenant": tenant, **entry}
+
+def get_task_leaderboard(db: sqlite3.Connection, task_type: str, limit: int):
+    """Top agents within one task type, read straight from the facet index"""
+    cursor = db.execute(f'''
+        SELECT users.user_id, username, first_name, {LIVE_SCORE_SQL}, tasks_completed,
+               f.score, f.evaluation_count, f.rating_sum
+        FROM reputation_facets f JOIN users ON users.user_id = f.user_id
+        WHERE f.task_type = ? AND f.evaluation_count > 0
+        ORDER BY f.score DESC LIMIT ?
+    ''', (task_type, limit))
     
     return {
+        "task_type": task_type,
         "leaderboard": [
             {
                 "rank": i + 1,
@@ -202,7 +456,9 @@ async def get_leaderboard(db: sqlite3.Connection = Depends(get_db), limit: int =
                 "first_name": row[2],
                 "reputation_score": row[3],
                 "tasks_completed": row[4],
-                "avg_rating": round(row[5] or 0, 2)
+                "task_score": row[5],
+                "task_evaluation_count": row[6],
+                "avg_rating": round(row[7] / row[6], 2)
             }
             for i, row in enumerate(cursor.fetchall())
         ]
@@ -211,29 +467,176 @@ async def get_leaderboard(db: sqlite3.Connection = Depends(get_db), limit: int =
 @app.get("/agents/trending")
 async def get_trending_agents(db: sqlite3.Connection = Depends(get_db)):
     """Get recently active agents with good ratings"""
-    cursor = db.execute('''
-        SELECT user_id, username, first_name, reputation_score,
-               (SELECT AVG(rating) FROM evaluations WHERE to_user_id = users.user_id) as avg_rating,
-               (SELECT COUNT(*) FROM evaluations WHERE to_user_id = users.user_id) as eval_count
+    return {"trending": query_trending(db)}
+
+def query_trending(db: sqlite3.Connection):
+    """Recently active agents; shared by /agents/trending and the live stream"""
+    cursor = db.execute(f'''
+        SELECT user_id, username, first_name, {LIVE_SCORE_SQL},
+               {AVG_RATING_SQL} as avg_rating,
+               {EVAL_COUNT_SQL} as eval_count
         FROM users 
         WHERE is_agent = 1
         ORDER BY last_active DESC 
         LIMIT 10
     ''')
     
-    return {
-        "trending": [
+    return [
+        {
+            "user_id": row[0],
+            "username": row[1] or row[2],
+            "reputation_score": row[3],
+            "avg_rating": round(row[4] or 0, 2),
+            "evaluation_count": row[5]
+        }
+        for row in cursor.fetchall()
+    ]
+
+# One broadcaster per tenant per worker: each change is queried, diffed and encoded once
+broadcaster_channels = {
+    "leaderboard": lambda db: query_leaderboard(db, PUSH_LEADERBOARD_SIZE),
+    "trending": query_trending,
+}
+broadcasters = BroadcasterPool(broadcaster_channels)
+
+@app.get("/stream/leaderboard")
+async def stream_leaderboard(request: Request):
+    """Server-sent events: a leaderboard/trending snapshot, then diffs as scores change"""
+    broadcaster = broadcasters.get(tenant_db_path(request))
+    if broadcaster.full():
+        raise HTTPException(status_code=503, detail="Too many live subscribers")
+    
+    return StreamingResponse(
+        broadcaster.sse_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/leaderboard")
+async def websocket_leaderboard(websocket: WebSocket):
+    """Same messages as /stream/leaderboard over a WebSocket"""
+    try:
+        broadcaster = broadcasters.get(tenant_db_path(websocket))
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    try:
+        subscriber, snapshot = await broadcaster.subscribe()
+    except OverflowError:
+        await websocket.close(code=1013)
+        return
+    try:
+        await broadcaster.websocket_session(websocket, subscriber, snapshot)
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/search")
+async def search(
+    q: str = Query(min_length=1, max_length=100),
+    db: sqlite3.Connection = Depends(get_db),
+    type: str = Query(default="all", pattern="^(all|agents|evaluations)$"),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=10000)
+):
+    """Ranked prefix search over agent names and evaluation comments"""
+    result = {"query": q, "limit": limit, "offset": offset}
+    
+    if type in ("all", "agents"):
+        rows = search_users(db, q, limit + 1, offset)
+        result["agents"] = [
             {
                 "user_id": row[0],
                 "username": row[1] or row[2],
+                "first_name": row[2],
                 "reputation_score": row[3],
-                "avg_rating": round(row[4] or 0, 2),
-                "evaluation_count": row[5]
+                "is_agent": bool(row[4])
             }
-            for row in cursor.fetchall()
+            for row in rows[:limit]
         ]
-    }
+        result["agents_has_more"] = len(rows) > limit
+    
+    if type in ("all", "evaluations"):
+        rows = search_evaluations(db, q, limit + 1, offset)
+        result["evaluations"] = [
+            {
+                "id": row[0],
+                "from_user_id": row[1],
+                "to_user_id": row[2],
+                "rating": row[3],
+                "comment": row[4],
+                "task_type": row[5],
+                "created_at": row[6],
+                "snippet": row[7]
+            }
+            for row in rows[:limit]
+        ]
+        result["evaluations_has_more"] = len(rows) > limit
+    
+    return result
+
+# ============ ADMIN ENDPOINTS ============
+
+def require_admin(x_atn_admin_token: Optional[str] = Header(default=None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if not (x_atn_admin_token and hmac.compare_digest(x_atn_admin_token, ADMIN_TOKEN)):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def submit_adjustment(db: sqlite3.Connection, op, func, **kwargs):
+    """Run an adjustment job write here, or on the writer in writer mode"""
+    try:
+        if writer_client:
+            return writer_client.submit(op, **kwargs)
+        result = func(db, **kwargs)
+        db.commit()
+        return result
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/adjustments", status_code=202, dependencies=[Depends(require_admin)])
+async def create_adjustment(data: AdjustmentCreate, db: sqlite3.Connection = Depends(get_db)):
+    """Queue a bulk score adjustment; poll GET /admin/adjustments/{id} for progress
+    
+    revoke_evaluations takes back everything from_user_id has given;
+    reweight_task_type makes task_type award rating * 10 * weight, past and future.
+    """
+    if data.kind == "revoke_evaluations":
+        if data.from_user_id is None:
+            raise HTTPException(status_code=400, detail="from_user_id is required")
+        target, weight = data.from_user_id, None
+    else:
+        if not data.task_type or data.weight is None:
+            raise HTTPException(status_code=400, detail="task_type and weight are required")
+        target, weight = normalize_task_type(data.task_type), data.weight
+    return await run_in_threadpool(submit_adjustment, db, "create_adjustment", create_job, kind=data.kind,
+                                   target=target, weight=weight, requested_by=data.requested_by)
+
+@app.get("/admin/adjustments", dependencies=[Depends(require_admin)])
+async def get_adjustments(db: sqlite3.Connection = Depends(get_db), limit: int = Query(default=20, ge=1, le=100)):
+    """Most recent adjustment jobs with their progress"""
+    return {"jobs": list_jobs(db, limit)}
+
+@app.get("/admin/adjustments/{job_id}", dependencies=[Depends(require_admin)])
+async def get_adjustment(job_id: int, db: sqlite3.Connection = Depends(get_db)):
+    """Progress of one adjustment job"""
+    try:
+        return get_job(db, job_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/admin/adjustments/{job_id}/resume", dependencies=[Depends(require_admin)])
+async def resume_adjustment(job_id: int, db: sqlite3.Connection = Depends(get_db)):
+    """Requeue a failed job; it continues from where it stopped"""
+    return await run_in_threadpool(submit_adjustment, db, "resume_adjustment", resume_job, job_id=job_id)
 
 @app.get("/health")
 async def health():
     return {"status": "ok", "service": "ATN API v2.0"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,240 @@
+"""ATN push - live leaderboard/trending diffs over SSE and WebSocket
+
+One Broadcaster per database (each tenant shard has its own) watches it with
+PRAGMA data_version (a no-I/O counter that changes whenever another
+connection commits). Broadcasters are started on first use by a
+BroadcasterPool, and ATN_PUSH_MAX_SUBSCRIBERS caps all of a process's
+subscribers together. When it
+changes and someone is listening, each channel (leaderboard, trending) is
+recomputed once, diffed against the previous snapshot, and the diff is
+serialised once and handed to every subscriber queue. A subscriber whose
+queue is full is dropped instead of slowing everyone else down; clients
+reconnect and start again from a fresh snapshot.
+"""
+
+import asyncio
+import json
+import logging
+import os
+
+from atn_common.metrics import Counter, Gauge, Histogram
+
+from writer import DB_PATH, connect_readonly
+
+logger = logging.getLogger(__name__)
+
+PUSH_INTERVAL = float(os.getenv("ATN_PUSH_INTERVAL", "1.0"))
+PUSH_QUEUE_SIZE = int(os.getenv("ATN_PUSH_QUEUE_SIZE", "16"))
+PUSH_MAX_SUBSCRIBERS = int(os.getenv("ATN_PUSH_MAX_SUBSCRIBERS", "10000"))
+PUSH_HEARTBEAT = float(os.getenv("ATN_PUSH_HEARTBEAT", "15"))
+PUSH_LEADERBOARD_SIZE = int(os.getenv("ATN_PUSH_LEADERBOARD_SIZE", "20"))
+
+PUSH_SUBSCRIBERS = Gauge("atn_push_subscribers", "Live leaderboard subscribers")
+PUSH_DROPPED = Counter("atn_push_dropped_total", "Live subscribers dropped for falling behind")
+PUSH_FANOUT = Histogram("atn_push_fanout_seconds", "Time to enqueue one diff for every subscriber")
+
+
+def diff_entries(old, new, key="user_id"):
+    """Entries added/changed, ids removed, and the new order if it moved"""
+    old_by_key = {entry[key]: entry for entry in old}
+    new_keys = [entry[key] for entry in new]
+    changes = {}
+    upsert = [entry for entry in new if old_by_key.get(entry[key]) != entry]
+    remove = [k for k in old_by_key if k not in set(new_keys)]
+    if upsert:
+        changes["upsert"] = upsert
+    if remove:
+        changes["remove"] = remove
+    if new_keys != [entry[key] for entry in old]:
+        changes["order"] = new_keys
+    return changes
+
+
+class Subscriber:
+    def __init__(self, queue_size=PUSH_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = False
+
+
+class Broadcaster:
+    """Computes each change once and fans the encoded diff out to every subscriber"""
+
+    live = 0  # subscribers of every broadcaster in this process
+
+    def __init__(self, channels, db_path=DB_PATH, interval=PUSH_INTERVAL):
+        self.channels = channels  # name -> fn(conn) returning a list of entries
+        self.db_path = db_path
+        self.interval = interval
+        self.subscribers = set()
+        self.snapshot = {}
+        self.seq = 0
+        self.dropped_total = 0
+        self._conn = None
+        self._data_version = None
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    # ---- lifecycle ----
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        for subscriber in list(self.subscribers):
+            self._close(subscriber)
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    # ---- subscriptions ----
+
+    def full(self):
+        return Broadcaster.live >= PUSH_MAX_SUBSCRIBERS
+
+    async def subscribe(self):
+        """Register a subscriber; returns (subscriber, encoded snapshot message)"""
+        if self.full():
+            raise OverflowError("Too many live subscribers")
+        async with self._lock:
+            # Catch up first so existing subscribers see the same diff this one skips
+            if await asyncio.to_thread(self._changed) or not self.snapshot:
+                await self._refresh()
+            subscriber = Subscriber()
+            self.subscribers.add(subscriber)
+            Broadcaster.live += 1
+            PUSH_SUBSCRIBERS.set(Broadcaster.live)
+            message = json.dumps({"type": "snapshot", "seq": self.seq, **self.snapshot})
+        return subscriber, message
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+            Broadcaster.live -= 1
+            PUSH_SUBSCRIBERS.set(Broadcaster.live)
+
+    def _close(self, subscriber):
+        """Forget the subscriber and wake its reader so the connection closes"""
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    def _drop(self, subscriber):
+        """Slow consumer: close it rather than buffer without bound"""
+        self._close(subscriber)
+        subscriber.dropped = True
+        self.dropped_total += 1
+        PUSH_DROPPED.inc()
+
+    def publish(self, message):
+        with PUSH_FANOUT.time():
+            for subscriber in list(self.subscribers):
+                try:
+                    subscriber.queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self._drop(subscriber)
+
+    # ---- change detection ----
+
+    def _changed(self):
+        if self._conn is None:
+            self._conn = connect_readonly(self.db_path)
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def _compute(self):
+        # Read all channels from one snapshot so they agree with each other
+        self._conn.execute("BEGIN")
+        try:
+            return {name: fn(self._conn) for name, fn in self.channels.items()}
+        finally:
+            self._conn.execute("COMMIT")
+
+    async def _refresh(self):
+        new = await asyncio.to_thread(self._compute)
+        diff = {name: diff_entries(self.snapshot.get(name, []), entries) for name, entries in new.items()}
+        diff = {name: changes for name, changes in diff.items() if changes}
+        self.snapshot = new
+        if diff:
+            self.seq += 1
+            self.publish(json.dumps({"type": "diff", "seq": self.seq, **diff}))
+
+    async def poll(self):
+        """Broadcast a diff if the DB changed since the last look"""
+        async with self._lock:
+            if await asyncio.to_thread(self._changed):
+                await self._refresh()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.subscribers:
+                continue
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Live leaderboard refresh failed")
+
+    # ---- transports ----
+
+    async def sse_events(self):
+        """Server-sent events stream: snapshot, then diffs, with heartbeat comments
+
+        The subscription is made when the response body starts, so a client
+        that goes away before then never leaves a queue behind.
+        """
+        try:
+            subscriber, snapshot = await self.subscribe()
+        except OverflowError:
+            return
+        try:
+            yield f"event: snapshot\ndata: {snapshot}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), PUSH_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if message is None:
+                    return
+                yield f"event: diff\ndata: {message}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def websocket_session(self, websocket, subscriber, snapshot):
+        """Send snapshot then diffs; returns when the client goes away or is dropped"""
+        try:
+            await websocket.send_text(snapshot)
+            while True:
+                message = await subscriber.queue.get()
+                if message is None:
+                    await websocket.close(code=1013)  # try again later
+                    return
+                await websocket.send_text(message)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+class BroadcasterPool:
+    """One Broadcaster per database, started the first time it is asked for"""
+
+    def __init__(self, channels, interval=PUSH_INTERVAL):
+        self.channels = channels
+        self.interval = interval
+        self.broadcasters = {}
+
+    def get(self, db_path):
+        broadcaster = self.broadcasters.get(db_path)
+        if broadcaster is None:
+            broadcaster = self.broadcasters[db_path] = Broadcaster(self.channels, db_path, self.interval)
+            broadcaster.start()
+        return broadcaster
+
+    async def stop(self):
+        for broadcaster in self.broadcasters.values():
+            await broadcaster.stop()
+        self.broadcasters.clear()
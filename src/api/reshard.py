@@ -0,0 +1,215 @@
+"""ATN resharding tool - move agents between tenant shards
+
+    python reshard.py list
+    python reshard.py import atn.db --tenant default
+    python reshard.py move --from default --to -1001234567890 --users 42 43 44
+    python reshard.py move --from -1001234567890 --to default --all
+
+`import` copies an unsharded database and its archive segments into one
+tenant shard with the online backup API. `move` carries users together with the evaluations they received
+and their reputation log into another shard, adding scores onto agents that
+already exist there (moving --all merges two tenants). Archived events of the
+moved users are copied back into the target's log, where its own compactor
+archives them again; the source's segments keep their copy. Facets, rollups
+and search indexes follow through their triggers.
+
+Run it with the API and bot stopped. Both shards are compacted first, and
+each chunk of --batch users is moved in one transaction across both files.
+That transaction first folds any source events logged since, so none are
+lost. The files are switched out of WAL for the duration so the transaction
+commits atomically, and re-running after an interruption simply resumes.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+
+# src/ holds the atn_common package shared with the bot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.eventlog import (  # noqa: E402
+    LOG_COLUMNS, archive_dir_for, compact_pending, list_segments, load_segment, run_maintenance,
+)
+from atn_common.sharding import SHARD_DIR, ShardRouter  # noqa: E402
+
+from schema import init_schema  # noqa: E402
+
+USER_COLUMNS = "user_id, username, first_name, reputation_score, tasks_completed, registered_at, last_active, is_agent"
+
+
+def compact_fully(path):
+    while run_maintenance(path)[0]:
+        pass
+
+
+def import_database(router, source, tenant):
+    """Copy a whole unsharded DB into an empty tenant shard"""
+    path = router.path_for(tenant)
+    if os.path.exists(path):
+        raise SystemExit(f"Shard for tenant {tenant} already exists: {path}")
+    os.makedirs(router.shard_dir, exist_ok=True)
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(path)
+    try:
+        src.backup(dst, pages=1024)
+        dst.execute("PRAGMA journal_mode=WAL")
+        init_schema(dst)
+        dst.commit()
+    finally:
+        src.close()
+        dst.close()
+    if os.path.isdir(archive_dir_for(source)):
+        shutil.copytree(archive_dir_for(source), archive_dir_for(path), dirs_exist_ok=True)
+    return count_users(path)
+
+
+def count_users(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def archived_events(db_path, user_ids):
+    """(user_id, change, reason, timestamp) of user_ids from db_path's archive, oldest first"""
+    wanted = set(user_ids)
+    events = []
+    for *_, path in reversed(list_segments(archive_dir_for(db_path))):
+        columns = load_segment(path)
+        events.extend(row[1:] for row in zip(*(columns[name] for name in LOG_COLUMNS)) if row[1] in wanted)
+    return events
+
+
+def _move_chunk(conn, user_ids, archived=()):
+    """Move one chunk of users from main to dst; caller owns the transaction"""
+    conn.execute("DELETE FROM temp.moving")
+    conn.executemany("INSERT INTO temp.moving (user_id) VALUES (?)", [(uid,) for uid in user_ids])
+    moving = "SELECT user_id FROM temp.moving"
+
+    # Source events not yet in users.reputation_score would be lost once they sit past the
+    # target's watermark, so fold them in under this transaction's lock (unqualified = main)
+    while compact_pending(conn):
+        pass
+    pending = conn.execute(
+        "SELECT COUNT(*) FROM dst.reputation_log WHERE id > (SELECT last_log_id FROM dst.reputation_compaction)"
+    ).fetchone()[0]
+    if pending:
+        raise RuntimeError("Target shard has uncompacted events; stop every writer and retry")
+
+    # Agents already on the target keep their row and gain the moved score
+    conn.execute(f'''
+        INSERT INTO dst.users ({USER_COLUMNS})
+        SELECT {USER_COLUMNS} FROM main.users WHERE user_id IN ({moving}) AND true
+        ON CONFLICT (user_id) DO UPDATE SET
+            reputation_score = reputation_score + excluded.reputation_score,
+            tasks_completed = tasks_completed + excluded.tasks_completed,
+            last_active = MAX(COALESCE(last_active, ''), COALESCE(excluded.last_active, '')),
+            is_agent = MAX(is_agent, excluded.is_agent)
+    ''')
+    conn.execute(f'''
+        INSERT INTO dst.evaluations (from_user_id, to_user_id, rating, comment, task_type, created_at)
+        SELECT from_user_id, to_user_id, rating, comment, task_type, created_at
+        FROM main.evaluations WHERE to_user_id IN ({moving}) ORDER BY id
+    ''')
+    # Archived events first so the target's ids stay in time order
+    conn.executemany("INSERT INTO dst.reputation_log (user_id, change, reason, timestamp) VALUES (?, ?, ?, ?)",
+                     archived)
+    conn.execute(f'''
+        INSERT INTO dst.reputation_log (user_id, change, reason, timestamp, actor_id)
+        SELECT user_id, change, reason, timestamp, actor_id
+        FROM main.reputation_log WHERE user_id IN ({moving}) ORDER BY id
+    ''')
+    # Moved events are already part of the moved scores
+    conn.execute("UPDATE dst.reputation_compaction SET last_log_id = "
+                 "(SELECT COALESCE(MAX(id), 0) FROM dst.reputation_log)")
+
+    conn.execute(f"DELETE FROM main.evaluations WHERE to_user_id IN ({moving})")
+    conn.execute(f"DELETE FROM main.reputation_log WHERE user_id IN ({moving})")
+    conn.execute(f"DELETE FROM main.reputation_rollup WHERE user_id IN ({moving})")
+    conn.execute(f"DELETE FROM main.reputation_facets WHERE user_id IN ({moving})")
+    conn.execute(f"DELETE FROM main.users WHERE user_id IN ({moving})")
+
+
+def move_users(router, source, target, user_ids=None, batch=500):
+    """Move user_ids (or every user) from one tenant to another; returns users moved"""
+    if source == target:
+        raise SystemExit("Source and target tenants are the same")
+    src_path, dst_path = router.ensure(source), router.ensure(target)
+    compact_fully(src_path)
+    compact_fully(dst_path)
+
+    conn = sqlite3.connect(src_path, timeout=30, isolation_level=None)
+    moved = 0
+    try:
+        conn.execute("ATTACH DATABASE ? AS dst", (dst_path,))
+        # Cross-file commits are only atomic with a rollback journal
+        conn.execute("PRAGMA main.journal_mode=DELETE")
+        conn.execute("PRAGMA dst.journal_mode=DELETE")
+        conn.execute("CREATE TEMP TABLE moving (user_id INTEGER PRIMARY KEY)")
+        if user_ids is None:
+            user_ids = [uid for (uid,) in conn.execute("SELECT user_id FROM main.users ORDER BY user_id")]
+        else:
+            present = {uid for (uid,) in conn.execute("SELECT user_id FROM main.users")}
+            user_ids = [uid for uid in user_ids if uid in present]
+
+        for start in range(0, len(user_ids), batch):
+            chunk = user_ids[start:start + batch]
+            archived = archived_events(src_path, chunk)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                _move_chunk(conn, chunk, archived)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            moved += len(chunk)
+            print(f"Moved {moved}/{len(user_ids)} users", file=sys.stderr)
+    finally:
+        conn.execute("PRAGMA main.journal_mode=WAL")
+        conn.execute("PRAGMA dst.journal_mode=WAL")
+        conn.close()
+    return moved
+
+
+def list_tenants(router):
+    for tenant in router.tenants():
+        path = router.path_for(tenant)
+        print(f"{tenant}\t{count_users(path)} users\t{os.path.getsize(path)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move ATN agents between tenant shards")
+    parser.add_argument("--shard-dir", default=SHARD_DIR or "shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("list", help="tenants with user counts")
+
+    imp = sub.add_parser("import", help="copy an unsharded DB into one tenant shard")
+    imp.add_argument("source")
+    imp.add_argument("--tenant", required=True)
+
+    move = sub.add_parser("move", help="move users (and their history) to another tenant")
+    move.add_argument("--from", dest="source", required=True)
+    move.add_argument("--to", dest="target", required=True)
+    who = move.add_mutually_exclusive_group(required=True)
+    who.add_argument("--users", type=int, nargs="+")
+    who.add_argument("--all", action="store_true", help="merge the whole source tenant into the target")
+    move.add_argument("--batch", type=int, default=500, help="users per transaction")
+
+    args = parser.parse_args()
+    router = ShardRouter(args.shard_dir, init=init_schema)
+    if args.command == "list":
+        list_tenants(router)
+    elif args.command == "import":
+        users = import_database(router, args.source, args.tenant)
+        print(f"Imported {users} users into tenant {args.tenant}", file=sys.stderr)
+    else:
+        moved = move_users(router, args.source, args.target, None if args.all else args.users, args.batch)
+        print(f"Moved {moved} users from {args.source} to {args.target}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
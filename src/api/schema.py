@@ -0,0 +1,77 @@
+"""ATN API - SQLite schema shared by the API workers, writer and tools"""
+
+from atn_common.adjustments import init_adjustments
+from atn_common.eventlog import init_eventlog
+from atn_common.idempotency import init_idempotency
+from atn_common.scheduler import init_scheduler
+from atn_common.search import init_search
+
+from analytics import init_facets, init_rollups
+
+
+def init_schema(conn):
+    """Create tables if missing; safe to call from every process on startup"""
+    cursor = conn.cursor()
+    
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            reputation_score INTEGER DEFAULT 0,
+            tasks_completed INTEGER DEFAULT 0,
+            registered_at TEXT,
+            last_active TEXT,
+            is_agent INTEGER DEFAULT 0
+        )
+    ''')
+    
+    # Reputation log
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reputation_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            change INTEGER,
+            reason TEXT,
+            timestamp TEXT
+        )
+    ''')
+    
+    # Evaluations/Feedback table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS evaluations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            to_user_id INTEGER,
+            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+            comment TEXT,
+            task_type TEXT,
+            created_at TEXT
+        )
+    ''')
+    
+    # Read paths filter evaluations by target and sort users by score
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_evaluations_to_user ON evaluations(to_user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_reputation ON users(reputation_score DESC)")
+    
+    # Event-sourced reputation: compaction watermark and per-user log index
+    init_eventlog(conn)
+    
+    # Hourly/daily reputation rollups maintained by trigger
+    init_rollups(conn)
+    
+    # FTS5 search over agents and evaluation comments
+    init_search(conn)
+    
+    # Admin adjustment jobs and the task weights facets and awards use
+    init_adjustments(conn)
+    
+    # Per-task-type facets maintained by trigger
+    init_facets(conn)
+    
+    # Idempotency keys for retried writes
+    init_idempotency(conn)
+    
+    # Lease rows that keep scheduled jobs single-flight across processes
+    init_scheduler(conn)
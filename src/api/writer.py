@@ -0,0 +1,285 @@
+"""ATN single-writer process
+
+SQLite allows one writer at a time. When the API runs with several uvicorn
+workers (and the bot shares the same DB file) every write races for the
+lock and eventually fails with "database is locked". In writer mode all
+writes are funneled to this one process over a local IPC socket while the
+API workers open the database read-only and serve GETs from WAL snapshots.
+
+Run it next to the API:
+
+    export ATN_WRITER_AUTHKEY=$(openssl rand -hex 32)
+    ATN_WRITER_ADDRESS=/tmp/atn-writer.sock python writer.py
+    ATN_WRITER_ADDRESS=/tmp/atn-writer.sock uvicorn main:app --workers 4
+
+The client side (WriterClient) lives in atn_common.writer_client so the bot
+can use it too.
+
+In writer mode the API workers and the bot never write the database, so the
+maintenance scheduler runs here instead (ATN_SCHEDULER). Jobs that write
+(VACUUM, ANALYZE, rebuilds, purges) are queued like client writes and run
+alone between two group commits. A long VACUUM therefore makes clients wait
+instead of failing with "database is locked". Leases live in a
+<db>-leases.db file, so claiming one never waits on the main database.
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import sys
+import time
+from datetime import datetime
+from multiprocessing.connection import Listener
+
+# src/ holds the atn_common package shared with the bot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.adjustments import ADJUST_INTERVAL, ADJUST_PAUSE, create_job, resume_job, run_chunk  # noqa: E402
+from atn_common.eventlog import (ARCHIVE_INTERVAL, COMPACT_INTERVAL, append_event,  # noqa: E402
+                                 archive_segments, compact_pending)
+from atn_common.idempotency import DuplicateRequest, claim_key, purge_expired  # noqa: E402
+from atn_common.maintenance import AGGREGATE_REBUILD_CRON, JOB_JITTER, register_maintenance_jobs  # noqa: E402
+from atn_common.metrics import db_factory  # noqa: E402
+from atn_common.scheduler import SCHEDULER_ENABLED, Cron, Scheduler  # noqa: E402
+from atn_common.users import apply_score_change, create_user, record_task_completed, set_agent  # noqa: E402
+from atn_common.writer_client import WRITER_ADDRESS, WRITER_AUTHKEY, parse_address, require_authkey  # noqa: E402
+
+from analytics import FACET_KEY_SQL, award_sql, rebuild_aggregates  # noqa: E402
+from backup import BACKUP_CRON, backup_job  # noqa: E402
+from schema import init_schema  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("DATABASE_URL", "sqlite:///atn.db").replace("sqlite:///", "")
+
+# Max number of queued writes folded into one transaction
+WRITER_BATCH_SIZE = int(os.getenv("ATN_WRITER_BATCH_SIZE", "256"))
+
+
+def connect_writable(path=DB_PATH):
+    """Open a write connection with WAL enabled so readers never block on us"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def connect_readonly(path=DB_PATH):
+    """Open a read-only connection that reads from the latest WAL snapshot"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30, check_same_thread=False,
+                           factory=db_factory)
+    conn.execute("PRAGMA query_only=1")
+    return conn
+
+
+# ============ WRITE OPERATIONS ============
+# Each op runs inside a transaction owned by the caller and must not commit.
+
+def apply_evaluation(conn, from_user_id, to_user_id, rating, comment=None, task_type="general",
+                     idempotency_key=None):
+    """Store an evaluation and award rating * 10 (times the task type's weight) to the target user"""
+    user = conn.execute("SELECT user_id FROM users WHERE user_id = ?", (to_user_id,)).fetchone()
+    if not user:
+        raise LookupError("Target user not found")
+
+    # Reputation change, folded into users by the compactor; same SQL as the facet triggers
+    score_change = conn.execute(f"SELECT {award_sql('?', FACET_KEY_SQL.format(col='?'))}",
+                                (rating, task_type)).fetchone()[0]
+    result = {"status": "success", "rating": rating, "score_awarded": score_change}
+    if idempotency_key:
+        claim_key(conn, idempotency_key, result)
+
+    now = datetime.now().isoformat()
+    conn.execute('''
+        INSERT INTO evaluations (from_user_id, to_user_id, rating, comment, task_type, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (from_user_id, to_user_id, rating, comment, task_type, now))
+    append_event(conn, to_user_id, score_change, f"Evaluation: {task_type}", now)
+
+    return result
+
+
+WRITE_OPS = {
+    "create_evaluation": apply_evaluation,
+    "update_user_score": apply_score_change,
+    "create_user": create_user,
+    "set_agent": set_agent,
+    "record_task_completed": record_task_completed,
+    "compact_reputation_log": lambda conn: {"folded": compact_pending(conn)},
+    "archive_reputation_log": lambda conn: {"segments": archive_segments(conn)},
+    "purge_idempotency_keys": lambda conn: {"purged": purge_expired(conn)},
+    "create_adjustment": create_job,
+    "resume_adjustment": resume_job,
+    "run_adjustment_chunk": lambda conn: run_chunk(conn),
+}
+
+# Internal op carrying a scheduled job; never accepted from clients
+MAINTENANCE_OP = "_maintenance"
+
+
+# ============ SERVER ============
+
+class WriterServer:
+    """Owns the only write connection and applies queued ops with group commit"""
+
+    def __init__(self, address=WRITER_ADDRESS, authkey=WRITER_AUTHKEY, db_path=DB_PATH):
+        self.address = parse_address(address)
+        self.authkey = require_authkey(authkey)
+        self.db_path = db_path
+        self.pending = queue.Queue()
+
+    def _apply_batch(self, conn, batch):
+        """Apply a batch in one transaction, isolating failures with savepoints"""
+        replies = []
+        conn.execute("BEGIN IMMEDIATE")
+        for op, kwargs, reply in batch:
+            handler = WRITE_OPS.get(op)
+            if handler is None:
+                replies.append((reply, ("error", f"Unknown op: {op}")))
+                continue
+            conn.execute("SAVEPOINT op")
+            try:
+                result = handler(conn, **kwargs)
+                conn.execute("RELEASE SAVEPOINT op")
+                replies.append((reply, ("ok", result)))
+            except LookupError as e:
+                conn.execute("ROLLBACK TO SAVEPOINT op")
+                conn.execute("RELEASE SAVEPOINT op")
+                replies.append((reply, ("not_found", str(e))))
+            except DuplicateRequest as e:
+                conn.execute("ROLLBACK TO SAVEPOINT op")
+                conn.execute("RELEASE SAVEPOINT op")
+                replies.append((reply, ("duplicate", e.result)))
+            except Exception as e:
+                conn.execute("ROLLBACK TO SAVEPOINT op")
+                conn.execute("RELEASE SAVEPOINT op")
+                logger.exception("Write op %s failed", op)
+                replies.append((reply, ("error", str(e))))
+        conn.execute("COMMIT")
+        # Only acknowledge once the whole batch is durable
+        for reply, result in replies:
+            reply.put(result)
+
+    def _run_maintenance(self, job):
+        """Run a scheduled job with the write connection idle, so it has the lock to itself"""
+        _, kwargs, reply = job
+        try:
+            reply.put(("ok", kwargs["func"](kwargs["db_path"])))
+        except Exception as e:
+            reply.put(("error", str(e)))
+
+    def _write_loop(self):
+        conn = connect_writable(self.db_path)
+        init_schema(conn)
+        conn.commit()
+        conn.isolation_level = None
+        while True:
+            batch = [self.pending.get()]
+            while len(batch) < WRITER_BATCH_SIZE and batch[-1][0] != MAINTENANCE_OP:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            # A maintenance job runs on its own, after the writes queued ahead of it
+            job = batch.pop() if batch[-1][0] == MAINTENANCE_OP else None
+            if batch:
+                try:
+                    self._apply_batch(conn, batch)
+                except sqlite3.Error as e:
+                    logger.exception("Write batch failed")
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    for _, _, reply in batch:
+                        reply.put(("error", str(e)))
+            if job:
+                self._run_maintenance(job)
+
+    def run_queued(self, func, db_path):
+        """Run func(db_path) on the write thread between two batches; blocks until done"""
+        reply = queue.Queue(maxsize=1)
+        self.pending.put((MAINTENANCE_OP, {"func": func, "db_path": db_path}, reply))
+        status, result = reply.get()
+        if status != "ok":
+            raise RuntimeError(result)
+        return result
+
+    def _serve_client(self, client):
+        reply = queue.Queue(maxsize=1)
+        try:
+            while True:
+                op, kwargs = client.recv()
+                if op == MAINTENANCE_OP:
+                    client.send(("error", f"Unknown op: {op}"))
+                    continue
+                self.pending.put((op, kwargs, reply))
+                client.send(reply.get())
+        except (EOFError, OSError):
+            pass
+        finally:
+            client.close()
+
+    def _maintenance_loop(self):
+        """Queue compaction like any other write so it never races client ops"""
+        last_archive = time.monotonic()
+        while True:
+            time.sleep(COMPACT_INTERVAL)
+            self.pending.put(("compact_reputation_log", {}, queue.Queue()))
+            if time.monotonic() - last_archive >= ARCHIVE_INTERVAL:
+                last_archive = time.monotonic()
+                self.pending.put(("archive_reputation_log", {}, queue.Queue()))
+                self.pending.put(("purge_idempotency_keys", {}, queue.Queue()))
+
+    def _adjustment_loop(self):
+        """Feed admin adjustment jobs through the queue one chunk at a time"""
+        while True:
+            reply = queue.Queue(maxsize=1)
+            self.pending.put(("run_adjustment_chunk", {}, reply))
+            status, job = reply.get()
+            time.sleep(ADJUST_PAUSE if status == "ok" and job else ADJUST_INTERVAL)
+
+    def _scheduler_thread(self):
+        """Maintenance jobs; the only scheduler running in writer mode"""
+        async def run():
+            scheduler = Scheduler(os.path.splitext(self.db_path)[0] + "-leases.db")
+            # The adjustment loop already feeds adjustment jobs through the queue
+            register_maintenance_jobs(scheduler, lambda: [self.db_path], adjustments=False, submit=self.run_queued)
+            scheduler.add("rebuild_aggregates", lambda: self.run_queued(rebuild_aggregates, self.db_path),
+                          Cron(AGGREGATE_REBUILD_CRON), JOB_JITTER)
+            if BACKUP_CRON:
+                # Online backups only read, so they run beside the writes
+                scheduler.add("backup", lambda: backup_job(self.db_path), Cron(BACKUP_CRON), JOB_JITTER,
+                              lease_seconds=6 * 3600)
+            scheduler.start()
+            await asyncio.Event().wait()
+
+        asyncio.run(run())
+
+    def serve_forever(self):
+        threading.Thread(target=self._write_loop, daemon=True).start()
+        threading.Thread(target=self._maintenance_loop, daemon=True).start()
+        threading.Thread(target=self._adjustment_loop, daemon=True).start()
+        if SCHEDULER_ENABLED:
+            threading.Thread(target=self._scheduler_thread, daemon=True).start()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info("ATN writer listening on %s", self.address)
+            while True:
+                try:
+                    client = listener.accept()
+                except Exception:
+                    logger.exception("Rejected writer client")
+                    continue
+                threading.Thread(target=self._serve_client, args=(client,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if not WRITER_ADDRESS:
+        raise SystemExit("Set ATN_WRITER_ADDRESS (unix socket path or host:port)")
+    if not WRITER_AUTHKEY:
+        raise SystemExit("Set ATN_WRITER_AUTHKEY to a shared secret; the writer never runs unauthenticated")
+    WriterServer().serve_forever()
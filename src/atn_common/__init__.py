@@ -0,0 +1,5 @@
+"""ATN common - modules shared by the API, the writer and the bot
+
+The entry points (src/api/main.py, src/bot/main.py and the CLI tools) put
+src/ on sys.path, so these import as atn_common.<module> from either side.
+"""
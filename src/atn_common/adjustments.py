@@ -0,0 +1,340 @@
+"""ATN adjustments - admin bulk score corrections run as chunked background jobs
+
+Two kinds of job:
+
+- revoke_evaluations takes back every evaluation one user has given. API
+  evaluations are deleted, and facets and search follow through their
+  triggers. Bot evaluations only exist as "Evaluation from @handle: ..." log
+  events carrying the evaluator's user id (reputation_log.actor_id), and
+  each one gets an equal and opposite event. Only bot events logged before
+  the job was created are revoked. Archived events, and bot events logged
+  before actor_id existed, are not revoked.
+- reweight_task_type sets the weight of one task type, so from then on its
+  evaluations award rating * 10 * weight. The job recomputes every
+  (task type, user) facet from its evaluations and logs the difference, so
+  re-running it or changing the weight again never compounds. The facet
+  score is the record of what was awarded, so the nightly facet rebuild
+  skips a task type until its reweight job is done (see REWEIGHTING_SQL).
+
+Scores only ever change through "Adjustment: ..." reputation_log events. The
+compactor folds them into users.reputation_score like any other change, the
+log stays a full audit trail, and the events do not count as user activity.
+
+Each job is a row in adjustment_jobs. It is worked through ATN_ADJUST_CHUNK
+rows at a time, and each chunk is a single short write transaction that also
+moves the job's cursor, so a crash or restart just resumes from the cursor.
+The scheduler runs pending jobs. In writer mode the writer process runs them.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from .eventlog import append_event
+
+ADJUST_CHUNK = int(os.getenv("ATN_ADJUST_CHUNK", "500"))
+ADJUST_PAUSE = float(os.getenv("ATN_ADJUST_PAUSE", "0.05"))
+ADJUST_INTERVAL = float(os.getenv("ATN_ADJUST_INTERVAL", "10"))
+ADJUST_SLICE = float(os.getenv("ATN_ADJUST_SLICE", "60"))  # seconds of work per scheduler run
+MAX_TASK_WEIGHT = 10.0
+
+KINDS = ("revoke_evaluations", "reweight_task_type")
+REASON_PREFIX = "Adjustment: "  # matches eventlog.PASSIVE_REASON_PATTERNS
+
+# Same normalisation as analytics.FACET_KEY_SQL, which is defined from this
+TASK_KEY_SQL = "lower(trim(COALESCE({col}, 'general')))"
+
+# Task types whose reweight job is unfinished; their facets still hold the scores awarded so far
+REWEIGHTING_SQL = "SELECT target FROM adjustment_jobs WHERE kind = 'reweight_task_type' AND status != 'done'"
+
+# Bot /evaluate logs "Evaluation from @<username or first name>: <rating>/5 stars" with actor_id set
+BOT_EVALUATION_REASON = "Evaluation from @%"
+
+JOB_COLUMNS = ("id, kind, target, params, status, phase, cursor, processed, total, score_delta, "
+               "requested_by, error, created_at, updated_at, finished_at")
+
+
+def init_adjustments(conn):
+    """Create the job and task weight tables; needs `evaluations` to exist"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS adjustment_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            target TEXT NOT NULL,
+            params TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'pending',
+            phase INTEGER NOT NULL DEFAULT 0,
+            cursor INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            score_delta INTEGER NOT NULL DEFAULT 0,
+            requested_by TEXT,
+            error TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            finished_at TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_adjustment_jobs_status ON adjustment_jobs(status, id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS task_weights (
+            task_type TEXT PRIMARY KEY,
+            weight REAL NOT NULL
+        )
+    ''')
+    # Revocation walks one evaluator's evaluations in id order
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluations_from_user ON evaluations(from_user_id, id)")
+
+
+def award_sql(rating, task_key):
+    """Points for one evaluation: rating * 10 scaled by the weight of task_key (already normalised)
+
+    Qualify column references (evaluations.task_type): a bare task_type would
+    resolve to task_weights inside the subquery.
+    """
+    return (f"CAST(ROUND({rating} * 10 * COALESCE((SELECT weight FROM task_weights "
+            f"WHERE task_weights.task_type = {task_key}), 1)) AS INTEGER)")
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+# ============ JOBS ============
+
+def describe_job(row):
+    """API/bot view of an adjustment_jobs row, with overall progress from 0 to 1"""
+    (job_id, kind, target, params, status, phase, cursor, processed, total, score_delta,
+     requested_by, error, created_at, updated_at, finished_at) = row
+    params = json.loads(params)
+    if status == "done":
+        progress = 1.0
+    elif kind == "revoke_evaluations":
+        # Phase 0 walks evaluations, phase 1 walks the evaluator's bot evaluation events
+        if phase == 0:
+            progress = 0.5 * (min(processed, total) / total if total else 1.0)
+        else:
+            span = params["log_upto"] - params["log_from"]
+            progress = 0.5 + 0.5 * ((cursor - params["log_from"]) / span if span else 1.0)
+    else:
+        progress = min(processed, total) / total if total else 1.0
+    return {
+        "id": job_id,
+        "kind": kind,
+        "target": target,
+        "weight": params.get("weight"),
+        "status": status,
+        "progress": round(progress, 4),
+        "processed": processed,
+        "total": total,
+        "score_delta": score_delta,
+        "requested_by": requested_by,
+        "error": error,
+        "created_at": created_at,
+        "updated_at": updated_at,
+        "finished_at": finished_at
+    }
+
+
+def get_job(conn, job_id):
+    row = conn.execute(f"SELECT {JOB_COLUMNS} FROM adjustment_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        raise LookupError("Adjustment job not found")
+    return describe_job(row)
+
+
+def list_jobs(conn, limit=20):
+    rows = conn.execute(f"SELECT {JOB_COLUMNS} FROM adjustment_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [describe_job(row) for row in rows]
+
+
+def create_job(conn, kind, target, weight=None, requested_by=None):
+    """Queue an adjustment and return it; caller owns the transaction
+
+    Raises LookupError for an unknown user and ValueError for bad input or
+    when an unfinished job for the same target exists (resume that instead).
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown adjustment kind: {kind}")
+    target = str(target).strip().lower() if kind == "reweight_task_type" else str(int(target))
+    unfinished = conn.execute(
+        "SELECT id, status FROM adjustment_jobs WHERE kind = ? AND target = ? AND status != 'done'",
+        (kind, target)
+    ).fetchone()
+    if unfinished:
+        raise ValueError(f"Job #{unfinished[0]} for {target} is still {unfinished[1]}")
+
+    if kind == "revoke_evaluations":
+        if not conn.execute("SELECT 1 FROM users WHERE user_id = ?", (int(target),)).fetchone():
+            raise LookupError("User not found")
+        # Bot events before an earlier completed revocation's horizon are already revoked
+        previous = conn.execute(
+            "SELECT MAX(json_extract(params, '$.log_upto')) FROM adjustment_jobs "
+            "WHERE kind = ? AND target = ? AND status = 'done'", (kind, target)
+        ).fetchone()[0]
+        log_from = previous or 0
+        params = {
+            "log_from": log_from,
+            "log_upto": max(log_from, conn.execute("SELECT COALESCE(MAX(id), 0) FROM reputation_log").fetchone()[0]),
+        }
+        total = conn.execute("SELECT COUNT(*) FROM evaluations WHERE from_user_id = ?", (int(target),)).fetchone()[0]
+    else:
+        if not target:
+            raise ValueError("task_type is required")
+        if weight is None or not 0 <= float(weight) <= MAX_TASK_WEIGHT:
+            raise ValueError(f"weight must be between 0 and {MAX_TASK_WEIGHT:g}")
+        if not _has_table(conn, "reputation_facets"):
+            raise ValueError("Re-weighting needs the API schema (reputation_facets)")
+        weight = float(weight)
+        previous = conn.execute("SELECT weight FROM task_weights WHERE task_type = ?", (target,)).fetchone()
+        params = {"weight": weight, "previous_weight": previous[0] if previous else 1.0}
+        # New evaluations award at the new weight from now on; the job fixes existing ones
+        if weight == 1.0:
+            conn.execute("DELETE FROM task_weights WHERE task_type = ?", (target,))
+        else:
+            conn.execute("INSERT OR REPLACE INTO task_weights (task_type, weight) VALUES (?, ?)", (target, weight))
+        total = conn.execute("SELECT COUNT(*) FROM reputation_facets WHERE task_type = ?", (target,)).fetchone()[0]
+
+    now = datetime.now().isoformat()
+    cursor = conn.execute('''
+        INSERT INTO adjustment_jobs (kind, target, params, total, requested_by, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (kind, target, json.dumps(params), total, requested_by, now, now))
+    return get_job(conn, cursor.lastrowid)
+
+
+def resume_job(conn, job_id):
+    """Put a failed job back in the queue; it carries on from its cursor"""
+    updated = conn.execute(
+        "UPDATE adjustment_jobs SET status = 'pending', error = NULL, updated_at = ? WHERE id = ? AND status = 'failed'",
+        (datetime.now().isoformat(), job_id)
+    ).rowcount
+    if not updated:
+        get_job(conn, job_id)  # LookupError if it doesn't exist
+        raise ValueError(f"Job #{job_id} has not failed")
+    return get_job(conn, job_id)
+
+
+# ============ CHUNKS ============
+
+def _revoke_step(conn, job, params, chunk):
+    """One chunk of revoke_evaluations; returns (phase, cursor, processed, score_delta, done)"""
+    now = datetime.now().isoformat()
+    if job["phase"] == 0:
+        key = TASK_KEY_SQL.format(col="evaluations.task_type")
+        rows = conn.execute(f'''
+            SELECT id, to_user_id, {award_sql("evaluations.rating", key)} FROM evaluations
+            WHERE from_user_id = ? AND id > ? ORDER BY id LIMIT ?
+        ''', (int(job["target"]), job["cursor"], chunk)).fetchall()
+        if not rows:
+            return 1, params["log_from"], 0, 0, False
+        for evaluation_id, to_user_id, award in rows:
+            append_event(conn, to_user_id, -award, f"{REASON_PREFIX}revoked evaluation #{evaluation_id}", now)
+        conn.executemany("DELETE FROM evaluations WHERE id = ?", [(row[0],) for row in rows])
+        return 0, rows[-1][0], len(rows), -sum(row[2] for row in rows), False
+
+    # By evaluator id, so renames and other users' look-alike names don't matter
+    rows = conn.execute('''
+        SELECT id, user_id, change FROM reputation_log
+        WHERE actor_id = ? AND id > ? AND id <= ? AND reason LIKE ? ORDER BY id LIMIT ?
+    ''', (int(job["target"]), job["cursor"], params["log_upto"], BOT_EVALUATION_REASON, chunk)).fetchall()
+    for log_id, user_id, change in rows:
+        append_event(conn, user_id, -change, f"{REASON_PREFIX}revoked log event #{log_id}", now)
+    done = len(rows) < chunk
+    cursor = params["log_upto"] if done else rows[-1][0]
+    return 1, cursor, len(rows), -sum(row[2] for row in rows), done
+
+
+def _reweight_step(conn, job, params, chunk):
+    """One chunk of reweight_task_type; returns (phase, cursor, processed, score_delta, done)"""
+    task_type = job["target"]
+    rows = conn.execute('''
+        SELECT user_id, score FROM reputation_facets WHERE task_type = ? AND user_id > ?
+        ORDER BY user_id LIMIT ?
+    ''', (task_type, job["cursor"], chunk)).fetchall()
+    if not rows:
+        return 0, job["cursor"], 0, 0, True
+
+    key = TASK_KEY_SQL.format(col="evaluations.task_type")
+    now = datetime.now().isoformat()
+    total_delta = 0
+    for user_id, score in rows:
+        # Same per-evaluation rounding as the facet triggers and apply_evaluation
+        target = conn.execute(f'''
+            SELECT COALESCE(SUM({award_sql("evaluations.rating", "?")}), 0) FROM evaluations
+            WHERE to_user_id = ? AND {key} = ?
+        ''', (task_type, user_id, task_type)).fetchone()[0]
+        delta = target - score
+        if delta:
+            conn.execute("UPDATE reputation_facets SET score = ? WHERE task_type = ? AND user_id = ?",
+                         (target, task_type, user_id))
+            append_event(conn, user_id, delta, f"{REASON_PREFIX}{task_type} reweighted to x{params['weight']:g}", now)
+            total_delta += delta
+    return 0, rows[-1][0], len(rows), total_delta, False
+
+
+STEPS = {
+    "revoke_evaluations": _revoke_step,
+    "reweight_task_type": _reweight_step,
+}
+
+
+def run_chunk(conn, chunk=ADJUST_CHUNK):
+    """Work one chunk of the oldest unfinished job; caller owns the transaction
+
+    Returns the job after the chunk, or None when no job is waiting. Lock
+    errors propagate so the chunk is retried later; any other error marks
+    the job failed.
+    """
+    row = conn.execute(
+        f"SELECT {JOB_COLUMNS} FROM adjustment_jobs WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return None
+    job = describe_job(row)
+    job["phase"], job["cursor"] = row[5], row[6]
+    now = datetime.now().isoformat()
+
+    conn.execute("SAVEPOINT adjustment_chunk")
+    try:
+        phase, cursor, processed, score_delta, done = STEPS[job["kind"]](conn, job, json.loads(row[3]), chunk)
+        conn.execute('''
+            UPDATE adjustment_jobs SET status = ?, phase = ?, cursor = ?, processed = processed + ?,
+                   score_delta = score_delta + ?, updated_at = ?, finished_at = ?
+            WHERE id = ?
+        ''', ("done" if done else "running", phase, cursor, processed, score_delta, now,
+              now if done else None, job["id"]))
+        conn.execute("RELEASE SAVEPOINT adjustment_chunk")
+    except sqlite3.OperationalError:
+        conn.execute("ROLLBACK TO SAVEPOINT adjustment_chunk")
+        conn.execute("RELEASE SAVEPOINT adjustment_chunk")
+        raise
+    except Exception as e:
+        conn.execute("ROLLBACK TO SAVEPOINT adjustment_chunk")
+        conn.execute("RELEASE SAVEPOINT adjustment_chunk")
+        conn.execute("UPDATE adjustment_jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                     (f"{type(e).__name__}: {e}", now, job["id"]))
+    return get_job(conn, job["id"])
+
+
+def run_pending(db_path, budget=ADJUST_SLICE):
+    """Scheduler job: work through unfinished jobs for up to `budget` seconds"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    deadline = time.monotonic() + budget
+    try:
+        while time.monotonic() < deadline:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                job = run_chunk(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if job is None:
+                return
+            # Give other writers the lock between chunks
+            time.sleep(ADJUST_PAUSE)
+    finally:
+        conn.close()
@@ -0,0 +1,283 @@
+"""ATN reputation event log - append-only score changes, compaction and archives
+
+Score changes are only ever INSERTed into reputation_log. users.reputation_score
+is a snapshot that the compactor advances by folding every event past the
+watermark (reputation_compaction.last_log_id) into it, so a hot agent's row
+is rewritten once per compaction instead of once per event. Reads that must
+be exact for a single user add the not-yet-compacted tail (LIVE_SCORE_SQL).
+Ranked lists and ranks use the same live scores without scanning every user:
+only users with pending events can differ from the snapshot, and there are
+few of them between compactions (LIVE_TOP_CTE, live_rank).
+
+Compacted events older than ATN_ARCHIVE_AFTER_DAYS are moved out of SQLite
+into gzip'd columnar JSON segments of ATN_ARCHIVE_SEGMENT_ROWS rows each (one
+file per segment, named by id range). read_history() reads the live table
+first and falls back to the newest segments. Each database file has its own
+"<db>-archive/" directory (log ids overlap between shards), next to the file
+or under ATN_ARCHIVE_DIR, so the API, the writer and the bot agree on the
+location whatever directory they run from.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+COMPACT_INTERVAL = float(os.getenv("ATN_COMPACT_INTERVAL", "5"))
+COMPACT_BATCH = int(os.getenv("ATN_COMPACT_BATCH", "50000"))
+ARCHIVE_INTERVAL = float(os.getenv("ATN_ARCHIVE_INTERVAL", "3600"))
+# Where the per-database "<db>-archive" directories go; empty = next to each database file
+ARCHIVE_DIR = os.getenv("ATN_ARCHIVE_DIR", "")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ATN_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_SEGMENT_ROWS = int(os.getenv("ATN_ARCHIVE_SEGMENT_ROWS", "100000"))
+
+SEGMENT_FORMAT = "atn-reputation-log/1"
+LOG_COLUMNS = ("id", "user_id", "change", "reason", "timestamp")
+
+# Events not yet folded into users.reputation_score; use inside a query on `users`
+PENDING_DELTA_SQL = '''COALESCE((SELECT SUM(change) FROM reputation_log
+    WHERE reputation_log.user_id = users.user_id
+      AND reputation_log.id > (SELECT last_log_id FROM reputation_compaction)), 0)'''
+LIVE_SCORE_SQL = f"(users.reputation_score + {PENDING_DELTA_SQL})"
+
+# Uncompacted delta of every user with pending events; +user_id keeps the planner on the
+# id range past the watermark instead of walking idx_reputation_log_user end to end
+PENDING_USERS_SQL = '''SELECT user_id, SUM(change) AS delta FROM reputation_log
+    WHERE id > (SELECT last_log_id FROM reputation_compaction) GROUP BY +user_id'''
+
+# `live_top` holds every user who can place in the :top best live scores, as users rows plus
+# live_score. Users past the snapshot's top (:top + pending users) have no pending events.
+LIVE_TOP_CTE = f'''pending AS MATERIALIZED ({PENDING_USERS_SQL}),
+    live_top AS (
+        SELECT users.*, users.reputation_score + COALESCE(pending.delta, 0) AS live_score
+        FROM (SELECT user_id FROM (SELECT user_id FROM users ORDER BY reputation_score DESC
+                                   LIMIT :top + (SELECT COUNT(*) FROM pending))
+              UNION SELECT user_id FROM pending) candidates
+        JOIN users ON users.user_id = candidates.user_id
+        LEFT JOIN pending ON pending.user_id = candidates.user_id
+    )'''
+
+# Events that change the score without the user doing anything (decay, admin adjustments)
+PASSIVE_REASON_PATTERNS = ("Decay:%", "Adjustment:%")
+
+
+def init_eventlog(conn):
+    """Create the compaction watermark (existing rows count as already compacted) and actor_id"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reputation_compaction (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_log_id INTEGER NOT NULL,
+            compacted_at TEXT
+        )
+    ''')
+    # Before event sourcing every log row was applied to users in place
+    conn.execute('''
+        INSERT OR IGNORE INTO reputation_compaction (id, last_log_id, compacted_at)
+        SELECT 1, COALESCE(MAX(id), 0), ? FROM reputation_log
+    ''', (datetime.now().isoformat(),))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reputation_log_user ON reputation_log(user_id, id)")
+    # Who caused the event, when someone did (the evaluator of a bot evaluation)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reputation_log)")}
+    if "actor_id" not in columns:
+        conn.execute("ALTER TABLE reputation_log ADD COLUMN actor_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reputation_log_actor ON reputation_log(actor_id, id) "
+                 "WHERE actor_id IS NOT NULL")
+
+
+def live_rank(conn, score):
+    """Leaderboard position of a live score: 1 + users whose live score is higher"""
+    return conn.execute(f'''
+        WITH pending AS MATERIALIZED ({PENDING_USERS_SQL})
+        SELECT 1 + (SELECT COUNT(*) FROM users WHERE reputation_score > :score)
+                 + (SELECT COALESCE(SUM((users.reputation_score + pending.delta > :score)
+                                        - (users.reputation_score > :score)), 0)
+                    FROM pending JOIN users ON users.user_id = pending.user_id)
+    ''', {"score": score}).fetchone()[0]
+
+
+def append_event(conn, user_id, change, reason, timestamp=None, actor_id=None):
+    """Record a score change; users.reputation_score catches up on compaction"""
+    conn.execute(
+        "INSERT INTO reputation_log (user_id, change, reason, timestamp, actor_id) VALUES (?, ?, ?, ?, ?)",
+        (user_id, change, reason, timestamp or datetime.now().isoformat(), actor_id)
+    )
+
+
+# ============ COMPACTION ============
+
+def compact_pending(conn, batch=COMPACT_BATCH):
+    """Fold up to `batch` events past the watermark into users; caller owns the transaction"""
+    last_id = conn.execute("SELECT last_log_id FROM reputation_compaction WHERE id = 1").fetchone()[0]
+    upto = conn.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM reputation_log WHERE id > ? ORDER BY id LIMIT ?)",
+        (last_id, batch)
+    ).fetchone()[0]
+    if upto is None:
+        return 0
+
+    # Passive events move the score but must not make a user look active
+    passive = " OR ".join("reason LIKE ?" for _ in PASSIVE_REASON_PATTERNS)
+    deltas = conn.execute(f'''
+        SELECT user_id, SUM(change), MAX(CASE WHEN {passive} THEN NULL ELSE timestamp END), COUNT(*)
+        FROM reputation_log WHERE id > ? AND id <= ? GROUP BY user_id
+    ''', (*PASSIVE_REASON_PATTERNS, last_id, upto)).fetchall()
+    conn.executemany(
+        "UPDATE users SET reputation_score = reputation_score + ?, "
+        "last_active = COALESCE(MAX(COALESCE(last_active, ''), ?), last_active) WHERE user_id = ?",
+        [(delta, latest, user_id) for user_id, delta, latest, _ in deltas]
+    )
+    conn.execute(
+        "UPDATE reputation_compaction SET last_log_id = ?, compacted_at = ? WHERE id = 1",
+        (upto, datetime.now().isoformat())
+    )
+    return sum(count for *_, count in deltas)
+
+
+# ============ ARCHIVES ============
+
+def archive_dir_for(db_path):
+    """Segment directory of one database: <db>-archive beside it or under ATN_ARCHIVE_DIR"""
+    base = os.path.splitext(os.path.abspath(db_path))[0]
+    return os.path.join(ARCHIVE_DIR or os.path.dirname(base), os.path.basename(base) + "-archive")
+
+
+def _conn_archive_dir(conn):
+    # main database file of this connection (read-only URI connections included)
+    return archive_dir_for(conn.execute("PRAGMA database_list").fetchone()[2])
+
+
+def _segment_name(first_id, last_id):
+    return f"reputation_log-{first_id:012d}-{last_id:012d}.json.gz"
+
+
+def _write_segment(archive_dir, rows):
+    os.makedirs(archive_dir, exist_ok=True)
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(LOG_COLUMNS)}
+    path = os.path.join(archive_dir, _segment_name(rows[0][0], rows[-1][0]))
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"format": SEGMENT_FORMAT, "first_id": rows[0][0], "last_id": rows[-1][0],
+                   "columns": columns}, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+    return path
+
+
+def archive_segments(conn, archive_dir=None, after_days=ARCHIVE_AFTER_DAYS,
+                     segment_rows=ARCHIVE_SEGMENT_ROWS, max_segments=1):
+    """Move full segments of old, compacted events to disk; caller owns the transaction
+
+    The segment file is written before the rows are deleted. If the delete
+    never commits the rows simply exist twice, and read_history() ignores
+    archived ids that are still live.
+    """
+    archive_dir = archive_dir or _conn_archive_dir(conn)
+    cutoff = (datetime.now() - timedelta(days=after_days)).isoformat()
+    watermark = conn.execute("SELECT last_log_id FROM reputation_compaction WHERE id = 1").fetchone()[0]
+    written = 0
+    while written < max_segments:
+        rows = conn.execute(
+            f"SELECT {', '.join(LOG_COLUMNS)} FROM reputation_log WHERE id <= ? ORDER BY id LIMIT ?",
+            (watermark, segment_rows)
+        ).fetchall()
+        # Only roll over full segments whose newest event is past the retention window
+        if len(rows) < segment_rows or (rows[-1][4] or "") >= cutoff:
+            break
+        path = _write_segment(archive_dir, rows)
+        conn.execute("DELETE FROM reputation_log WHERE id BETWEEN ? AND ?", (rows[0][0], rows[-1][0]))
+        logger.info("Archived reputation_log ids %s-%s to %s", rows[0][0], rows[-1][0], path)
+        written += 1
+    return written
+
+
+def list_segments(archive_dir):
+    """(first_id, last_id, path) for every archive segment, newest first"""
+    if not os.path.isdir(archive_dir):
+        return []
+    segments = []
+    for name in os.listdir(archive_dir):
+        if name.startswith("reputation_log-") and name.endswith(".json.gz"):
+            first_id, last_id = name[len("reputation_log-"):-len(".json.gz")].split("-")
+            segments.append((int(first_id), int(last_id), os.path.join(archive_dir, name)))
+    return sorted(segments, reverse=True)
+
+
+def load_segment(path):
+    """Column dict of one segment file"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["columns"]
+
+
+@lru_cache(maxsize=8)
+def _segment_by_user(path):
+    """Segments are immutable, so index them by user once and keep the newest few"""
+    columns = load_segment(path)
+    by_user = {}
+    for row in zip(*(columns[name] for name in LOG_COLUMNS)):
+        by_user.setdefault(row[1], []).append(row)
+    for rows in by_user.values():
+        rows.reverse()
+    return by_user
+
+
+def read_history(conn, user_id, limit=20, archive_dir=None):
+    """Newest `limit` (change, reason, timestamp) events across the live table and archives"""
+    rows = conn.execute(
+        "SELECT id, change, reason, timestamp FROM reputation_log WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+        (user_id, limit)
+    ).fetchall()
+    history = [(change, reason, timestamp) for _, change, reason, timestamp in rows]
+    if len(history) >= limit:
+        return history
+
+    min_live_id = conn.execute("SELECT MIN(id) FROM reputation_log").fetchone()[0]
+    for first_id, _, path in list_segments(archive_dir or _conn_archive_dir(conn)):
+        if min_live_id is not None and first_id >= min_live_id:
+            continue
+        for row_id, _, change, reason, timestamp in _segment_by_user(path).get(user_id, ()):
+            if min_live_id is not None and row_id >= min_live_id:
+                continue
+            history.append((change, reason, timestamp))
+            if len(history) >= limit:
+                return history
+    return history
+
+
+# ============ BACKGROUND LOOP ============
+
+def run_maintenance(db_path, archive=False):
+    """Compact (and optionally archive) in one short write transaction"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        folded = compact_pending(conn)
+        segments = archive_segments(conn) if archive else 0
+        conn.commit()
+        return folded, segments
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+async def compactor_loop(db_path, interval=COMPACT_INTERVAL, archive_interval=ARCHIVE_INTERVAL):
+    """Run compaction every `interval` seconds and archiving every `archive_interval`"""
+    last_archive = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        archive = time.monotonic() - last_archive >= archive_interval
+        try:
+            folded, segments = await asyncio.to_thread(run_maintenance, db_path, archive)
+            if archive:
+                last_archive = time.monotonic()
+            if folded or segments:
+                logger.debug("Compacted %s events, archived %s segments", folded, segments)
+        except sqlite3.Error:
+            logger.exception("Reputation log compaction failed")
@@ -0,0 +1,129 @@
+"""ATN idempotency - reject retried writes without double-applying reputation
+
+Clients may retry POST /evaluations with the same Idempotency-Key and
+Telegram redelivers updates it thinks were lost. Every keyed write claims
+its key in idempotency_keys (PRIMARY KEY, same transaction as the write)
+before touching anything, so a duplicate fails on the unique index and gets
+the first result back instead of applying again.
+
+RecentKeys remembers the newest keys in memory so most retries are answered
+without touching SQLite at all; older ones are still caught by the index.
+With ATN_IDEMPOTENCY_BLOOM_BITS set, a Bloom filter also remembers every key
+this process has seen, and keys that fell out of the LRU but may have been
+seen are looked up before the write is sent. New keys (the common case)
+never pay for that read.
+
+The bot's update_id dedup middleware lives in src/bot/middleware.py.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from .metrics import record_cache
+
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("ATN_IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_BLOOM_BITS = int(os.getenv("ATN_IDEMPOTENCY_BLOOM_BITS", "0"))  # 0 disables the filter
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("ATN_IDEMPOTENCY_TTL_HOURS", "48"))
+MAX_KEY_LENGTH = 200
+
+
+class DuplicateRequest(Exception):
+    """The key was already used; `result` is what the first request returned"""
+
+    def __init__(self, result):
+        super().__init__("Duplicate request")
+        self.result = result
+
+
+def init_idempotency(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def claim_key(conn, key, result):
+    """Record key -> result inside the caller's transaction, or raise DuplicateRequest"""
+    try:
+        conn.execute(
+            "INSERT INTO idempotency_keys (key, result, created_at) VALUES (?, ?, ?)",
+            (key, json.dumps(result), datetime.now().isoformat())
+        )
+    except sqlite3.IntegrityError:
+        previous = lookup_key(conn, key)
+        if previous is None:
+            raise
+        raise DuplicateRequest(previous)
+
+
+def lookup_key(conn, key):
+    """Stored result for a key, or None"""
+    row = conn.execute("SELECT result FROM idempotency_keys WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def purge_expired(conn, ttl_hours=IDEMPOTENCY_TTL_HOURS):
+    """Forget keys older than any sane retry window; caller owns the transaction"""
+    cutoff = (datetime.now() - timedelta(hours=ttl_hours)).isoformat()
+    return conn.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (cutoff,)).rowcount
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (no false negatives)"""
+
+    def __init__(self, bits, hashes=7):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RecentKeys:
+    """Bounded LRU of key -> result, optionally backed by a Bloom filter of every key seen
+
+    Lookups are counted in atn_cache_requests_total under `name`.
+    """
+
+    def __init__(self, name, capacity=IDEMPOTENCY_CACHE_SIZE, bloom_bits=IDEMPOTENCY_BLOOM_BITS):
+        self.name = name
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.bloom = BloomFilter(bloom_bits) if bloom_bits else None
+
+    def get(self, key):
+        result = self.items.get(key)
+        if result is not None:
+            self.items.move_to_end(key)
+        record_cache(self.name, result is not None)
+        return result
+
+    def add(self, key, result=True):
+        self.items[key] = result
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+        if self.bloom is not None:
+            self.bloom.add(key)
+
+    def maybe_evicted(self, key):
+        """True if the key may have been seen but is no longer in the LRU"""
+        return self.bloom is not None and key not in self.items and key in self.bloom
@@ -0,0 +1,185 @@
+"""ATN maintenance jobs run by the scheduler in the API and the bot (or writer.py)
+
+Heavy jobs (VACUUM, search index merges, decay) default to cron slots in the
+small hours so they never compete with peak traffic; cheap ones (WAL
+checkpoint, cache warm-up) run on short intervals. Every job takes a DB path
+and is applied to every database the process serves (every shard in sharded
+mode). Decay and stale-agent cleanup change scores/visibility and are off
+unless configured. In writer mode only writer.py schedules them, and it
+queues every job that writes behind the client writes.
+"""
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from .adjustments import ADJUST_INTERVAL, ADJUST_SLICE, run_pending
+from .eventlog import append_event
+from .idempotency import purge_expired
+from .scheduler import Cron, Interval
+
+JOB_JITTER = float(os.getenv("ATN_JOB_JITTER", "30"))
+CHECKPOINT_INTERVAL = float(os.getenv("ATN_CHECKPOINT_INTERVAL", "300"))
+WARMUP_INTERVAL = float(os.getenv("ATN_WARMUP_INTERVAL", "600"))
+ANALYZE_CRON = os.getenv("ATN_ANALYZE_CRON", "17 * * * *")
+PURGE_CRON = os.getenv("ATN_PURGE_CRON", "7 * * * *")
+SEARCH_OPTIMIZE_CRON = os.getenv("ATN_SEARCH_OPTIMIZE_CRON", "40 3 * * *")
+VACUUM_CRON = os.getenv("ATN_VACUUM_CRON", "30 4 * * 0")
+AGGREGATE_REBUILD_CRON = os.getenv("ATN_AGGREGATE_REBUILD_CRON", "50 3 * * *")  # API or writer only
+
+# Off by default: percent of score lost per sweep by agents idle for DECAY_AFTER_DAYS
+DECAY_PERCENT = float(os.getenv("ATN_DECAY_PERCENT", "0"))
+DECAY_AFTER_DAYS = int(os.getenv("ATN_DECAY_AFTER_DAYS", "30"))
+DECAY_CRON = os.getenv("ATN_DECAY_CRON", "0 3 * * *")
+
+# Off by default: hide agents with no score and no evaluations idle this long
+STALE_AGENT_DAYS = int(os.getenv("ATN_STALE_AGENT_DAYS", "0"))
+STALE_AGENT_CRON = os.getenv("ATN_STALE_AGENT_CRON", "20 3 * * *")
+
+DECAY_REASON = "Decay: inactive"  # matches eventlog.PASSIVE_REASON_PATTERNS
+
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA busy_timeout=60000")
+    return conn
+
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def wal_checkpoint(db_path):
+    """Fold the WAL back into the DB file and truncate it"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    finally:
+        conn.close()
+
+
+def analyze(db_path):
+    """Refresh planner statistics, sampling so it stays cheap on big tables"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("PRAGMA analysis_limit=1000")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def vacuum(db_path):
+    """Rebuild the DB file to reclaim space from deleted/archived rows"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def optimize_search(db_path):
+    """Merge FTS5 index segments built up by trigger inserts"""
+    conn = _connect(db_path)
+    try:
+        for table in ("users_fts", "evaluations_fts"):
+            if _has_table(conn, table):
+                conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def purge_idempotency_keys(db_path):
+    conn = _connect(db_path)
+    try:
+        purge_expired(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def warm_cache(db_path):
+    """Pull the hot index pages (leaderboard, facets, log tail) into the OS page cache"""
+    conn = _connect(db_path)
+    try:
+        conn.execute("SELECT user_id, reputation_score FROM users ORDER BY reputation_score DESC LIMIT 1000").fetchall()
+        if _has_table(conn, "reputation_facets"):
+            conn.execute("SELECT COUNT(*) FROM reputation_facets").fetchone()
+        conn.execute("SELECT COUNT(*) FROM reputation_log WHERE id > "
+                     "(SELECT last_log_id FROM reputation_compaction)").fetchone()
+    finally:
+        conn.close()
+
+
+def decay_inactive(db_path, percent=DECAY_PERCENT, after_days=DECAY_AFTER_DAYS):
+    """Append a negative event for every positive score idle longer than after_days"""
+    cutoff = (datetime.now() - timedelta(days=after_days)).isoformat()
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute('''
+            SELECT user_id, reputation_score FROM users
+            WHERE reputation_score > 0 AND COALESCE(last_active, registered_at, '') < ?
+        ''', (cutoff,)).fetchall()
+        now = datetime.now().isoformat()
+        for user_id, score in rows:
+            change = -int(score * percent / 100)
+            if change:
+                append_event(conn, user_id, change, DECAY_REASON, now)
+        conn.commit()
+        return len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def cleanup_stale_agents(db_path, after_days=STALE_AGENT_DAYS):
+    """Drop the agent flag from registrations that never earned anything"""
+    cutoff = (datetime.now() - timedelta(days=after_days)).isoformat()
+    conn = _connect(db_path)
+    try:
+        cursor = conn.execute('''
+            UPDATE users SET is_agent = 0
+            WHERE is_agent = 1 AND reputation_score = 0
+              AND COALESCE(last_active, registered_at, '') < ?
+              AND NOT EXISTS (SELECT 1 FROM evaluations WHERE evaluations.to_user_id = users.user_id)
+              AND NOT EXISTS (SELECT 1 FROM reputation_log WHERE reputation_log.user_id = users.user_id)
+        ''', (cutoff,))
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+
+def for_each_db(func, db_paths):
+    """Job that applies func(path) to every path db_paths() returns at run time"""
+    return lambda: [func(path) for path in db_paths()]
+
+
+def register_maintenance_jobs(scheduler, db_paths, adjustments=True, submit=None):
+    """Add the standard jobs; db_paths() returns every database to maintain
+
+    Pass adjustments=False where the writer process runs admin adjustment jobs.
+    submit(func, path) runs each job that writes; the writer passes one that
+    queues it behind client writes instead of racing them for the lock.
+    """
+    def each(func, writes=True):
+        if submit and writes:
+            return lambda: [submit(func, path) for path in db_paths()]
+        return for_each_db(func, db_paths)
+
+    scheduler.add("wal_checkpoint", each(wal_checkpoint), Interval(CHECKPOINT_INTERVAL), JOB_JITTER)
+    scheduler.add("warm_cache", each(warm_cache, writes=False), Interval(WARMUP_INTERVAL), JOB_JITTER)
+    scheduler.add("analyze", each(analyze), Cron(ANALYZE_CRON), JOB_JITTER)
+    scheduler.add("purge_idempotency_keys", each(purge_idempotency_keys), Cron(PURGE_CRON), JOB_JITTER)
+    scheduler.add("optimize_search", each(optimize_search), Cron(SEARCH_OPTIMIZE_CRON), JOB_JITTER)
+    scheduler.add("vacuum", each(vacuum), Cron(VACUUM_CRON), JOB_JITTER, lease_seconds=6 * 3600)
+    if DECAY_PERCENT:
+        scheduler.add("decay_inactive", each(decay_inactive), Cron(DECAY_CRON), JOB_JITTER)
+    if STALE_AGENT_DAYS:
+        scheduler.add("cleanup_stale_agents", each(cleanup_stale_agents), Cron(STALE_AGENT_CRON), JOB_JITTER)
+    if adjustments:
+        scheduler.add("adjustments", each(run_pending), Interval(ADJUST_INTERVAL), lease_seconds=5 * ADJUST_SLICE)
@@ -0,0 +1,326 @@
+"""ATN metrics - Prometheus text-format counters, gauges and histograms
+
+Kept dependency-free on purpose: the API, the writer and the bot all import
+it. The bot's command middleware lives in src/bot/middleware.py.
+Set ATN_METRICS=0 to turn every observe/inc into a no-op and keep plain
+sqlite3 connections on the hot path.
+
+Metrics live in process memory, so with uvicorn --workers N each scrape
+would see one arbitrary worker. Point ATN_METRICS_DIR at a directory shared
+by the workers of one service (and nothing else): every worker then writes
+its values to <pid>.json every ATN_METRICS_FLUSH_INTERVAL seconds and on
+shutdown, and render_metrics() adds up all of them. Gauges of workers that
+have exited are dropped; their counters and histograms keep counting.
+"""
+
+import atexit
+import http.server
+import json
+import logging
+import os
+import re
+import socketserver
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("ATN_METRICS", "1") not in ("0", "false", "no")
+# Empty = every process reports only its own values
+METRICS_DIR = os.getenv("ATN_METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("ATN_METRICS_FLUSH_INTERVAL", "5"))
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def snapshot(self):
+        """{labels: value} copy, safe to merge and render outside the lock"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(into, labels, value):
+        into[labels] = into.get(labels, 0) + value
+
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: list(state) for labels, state in self._values.items()}
+
+    @staticmethod
+    def merge(into, labels, value):
+        state = into.get(labels)
+        into[labels] = value if state is None else [a + b for a, b in zip(state, value)]
+
+    def render(self, values):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for labels, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), state[:-1]):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {state[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+def render_metrics():
+    """Render every registered metric in Prometheus text exposition format
+
+    With ATN_METRICS_DIR set, the other workers' last flushed values are added in.
+    """
+    values = {metric.name: metric.snapshot() for metric in REGISTRY}
+    if METRICS_DIR:
+        for pid, dumped in _read_dumps():
+            alive = _alive(pid)
+            for metric in REGISTRY:
+                if metric.kind == "gauge" and not alive:
+                    continue
+                for labels, value in dumped.get(metric.name, ()):
+                    metric.merge(values[metric.name], tuple(labels), value)
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(values[metric.name]))
+    return "\n".join(lines) + "\n"
+
+
+# ============ MULTI-PROCESS ============
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_dumps():
+    """(pid, {name: [[labels, value], ...]}) of every other process in ATN_METRICS_DIR"""
+    if not os.path.isdir(METRICS_DIR):
+        return []
+    dumps = []
+    for entry in os.listdir(METRICS_DIR):
+        stem, ext = os.path.splitext(entry)
+        if ext != ".json" or not stem.isdigit() or int(stem) == os.getpid():
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, entry)) as f:
+                dumps.append((int(stem), json.load(f)))
+        except (OSError, ValueError):
+            continue  # replaced or removed while we looked
+    return dumps
+
+
+def flush_metrics():
+    """Write this process's values to ATN_METRICS_DIR/<pid>.json for the other workers to add up"""
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    dump = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+            for metric in REGISTRY}
+    with open(path + ".tmp", "w") as f:
+        json.dump(dump, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def start_metrics_flusher(interval=METRICS_FLUSH_INTERVAL):
+    """Flush every `interval` seconds and at exit; no-op unless ATN_METRICS_DIR is set"""
+    if not (METRICS_ENABLED and METRICS_DIR):
+        return None
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                flush_metrics()
+            except OSError:
+                logger.exception("Writing metrics to %s failed", METRICS_DIR)
+
+    atexit.register(flush_metrics)
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# ============ SQLITE INSTRUMENTATION ============
+
+SQL_DURATION = Histogram("atn_sql_statement_duration_seconds", "SQLite statement execution time", ("statement",))
+DB_CONNECTIONS_OPEN = Gauge("atn_db_connections_open", "Currently open SQLite connections")
+DB_CONNECTIONS_TOTAL = Counter("atn_db_connections_total", "SQLite connections opened")
+CACHE_REQUESTS = Counter("atn_cache_requests_total", "Cache lookups by result", ("cache", "result"))
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|JOIN)\s+(?:IF\s+NOT\s+EXISTS\s+)?([A-Za-z_][A-Za-z0-9_]*)", re.I)
+
+
+def statement_label(sql):
+    """Collapse a statement to 'VERB table' so label cardinality stays bounded"""
+    stripped = sql.lstrip()
+    verb = stripped.split(None, 1)[0].upper() if stripped else "EMPTY"
+    match = _TABLE_RE.search(stripped)
+    return f"{verb} {match.group(1)}" if match else verb
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            SQL_DURATION.observe(time.perf_counter() - start, statement_label(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            SQL_DURATION.observe(time.perf_counter() - start, statement_label(sql))
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 has no per-statement profile hook, so time execute() instead"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._counted = True
+        DB_CONNECTIONS_OPEN.inc()
+        DB_CONNECTIONS_TOTAL.inc()
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._counted:
+            self._counted = False
+            DB_CONNECTIONS_OPEN.dec()
+        super().close()
+
+
+# Pass as sqlite3.connect(..., factory=db_factory)
+db_factory = TimedConnection if METRICS_ENABLED else sqlite3.Connection
+
+
+# ============ EXPORTER ============
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve /metrics from a daemon thread so scraping never touches the event loop"""
+    server = socketserver.ThreadingTCPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
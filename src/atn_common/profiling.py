@@ -0,0 +1,117 @@
+"""ATN profiling - on-demand sampling profiler with an on-disk ring buffer
+
+A background thread snapshots the handling thread's stack every few ms via
+sys._current_frames() while one request runs, then writes the samples in
+folded-stack format ("frame;frame;frame count") which flamegraph.pl,
+speedscope and inferno all read directly. Only the newest
+ATN_PROFILE_KEEP files are kept in ATN_PROFILE_DIR.
+
+For async handlers the sampled thread is the event loop, so concurrent
+requests interleaved on the loop show up in the same profile.
+
+The bot's aiogram middleware lives in src/bot/middleware.py.
+"""
+
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profile one request in N (0 = only on demand)
+PROFILE_EVERY = int(os.getenv("ATN_PROFILE_EVERY", "0"))
+PROFILE_INTERVAL = float(os.getenv("ATN_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("ATN_PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("ATN_PROFILE_KEEP", "200"))
+# API requests carrying `X-ATN-Profile: <token>` are always profiled
+PROFILE_TOKEN = os.getenv("ATN_PROFILE_TOKEN", "")
+PROFILE_HEADER = "x-atn-profile"
+
+PROFILING_ENABLED = PROFILE_EVERY > 0 or bool(PROFILE_TOKEN)
+
+_request_counter = itertools.count(1)
+_file_counter = itertools.count(1)
+_write_lock = threading.Lock()
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def should_sample():
+    """1-in-N sampling decision; a shared counter is cheaper than random()"""
+    return PROFILE_EVERY > 0 and next(_request_counter) % PROFILE_EVERY == 0
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def _prune(directory, keep):
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".folded")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in entries[:max(0, len(entries) - keep)]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def write_profile(label, samples, elapsed, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Write folded stacks to the ring buffer and evict the oldest files"""
+    if not samples:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.{next(_file_counter)}-{_UNSAFE_CHARS.sub('_', label).strip('_')}-{elapsed * 1000:.0f}ms.folded"
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    with _write_lock:
+        _prune(directory, keep)
+    return path
+
+
+class StackSampler:
+    """Samples one thread's stack on an interval until stop() is called"""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._label = None
+        self._started_at = 0.0
+        self._elapsed = 0.0
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self, label):
+        """Stop sampling; the sampler thread writes the profile off the hot path"""
+        self._elapsed = time.perf_counter() - self._started_at
+        self._label = label
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_fold(frame)] += 1
+        try:
+            write_profile(self._label, self.samples, self._elapsed)
+        except OSError:
+            pass
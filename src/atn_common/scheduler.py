@@ -0,0 +1,224 @@
+"""ATN scheduler - asyncio cron/interval jobs with cross-process single-flight
+
+Every API worker and the bot run the same Scheduler with the same jobs. Fire
+times are computed identically everywhere (cron times, or interval slots
+aligned to the epoch), and before running a slot each process tries to take
+the job's lease row in scheduler_leases. Only the process that claims the
+slot runs it, so a job never runs twice for one slot and never overlaps
+itself, however many processes are up. A lease that is never released (the
+owner crashed) expires after the job's lease time.
+
+Jobs are plain functions and run in a thread. Each run is timed in
+atn_scheduler_job_duration_seconds and counted in atn_scheduler_job_runs_total.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from .metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("ATN_SCHEDULER", "1") not in ("0", "false", "no")
+
+JOB_DURATION = Histogram("atn_scheduler_job_duration_seconds", "Scheduled job run time", ("job", "status"),
+                         buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0))
+JOB_RUNS = Counter("atn_scheduler_job_runs_total", "Scheduled job slots by outcome", ("job", "result"))
+
+
+# ============ TRIGGERS ============
+
+class Interval:
+    """Every `seconds`, on slots aligned to the epoch so all processes agree"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_fire(self, after):
+        ts = after.timestamp()
+        return datetime.fromtimestamp((ts // self.seconds + 1) * self.seconds)
+
+    def __repr__(self):
+        return f"every {self.seconds}s"
+
+
+class Cron:
+    """Five-field cron expression (minute hour day-of-month month day-of-week), local time
+
+    Fields accept *, numbers, ranges (1-5), lists (1,15) and steps (*/10, 0-30/5).
+    Day of week is 0-6 with 0 = Sunday (7 is accepted for Sunday too).
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, dow = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES))
+        self.weekdays = {day % 7 for day in dow}
+        # Vixie cron: when both day fields are restricted, either may match
+        self.days_restricted = fields[2] != "*"
+        self.weekdays_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            spec, _, step = part.partition("/")
+            if spec == "*":
+                start, end = low, high
+            elif "-" in spec:
+                start, end = (int(x) for x in spec.split("-"))
+            else:
+                start = end = int(spec)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field {field!r} out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment):
+        dom = moment.day in self.days
+        dow = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return dom or dow
+        return dom and dow
+
+    def next_fire(self, after):
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def __repr__(self):
+        return f"cron {self.expression!r}"
+
+
+# ============ LEASES ============
+
+def init_scheduler(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_leases (
+            job TEXT PRIMARY KEY,
+            owner TEXT,
+            slot REAL NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL DEFAULT 0,
+            last_finished_at TEXT,
+            last_status TEXT,
+            last_duration REAL
+        )
+    ''')
+
+
+def acquire_lease(conn, job, owner, slot, lease_seconds):
+    """Claim `slot` of `job` unless another process already has it or it is still running"""
+    now = time.time()
+    cursor = conn.execute('''
+        INSERT INTO scheduler_leases (job, owner, slot, expires_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (job) DO UPDATE SET owner = excluded.owner, slot = excluded.slot,
+                                        expires_at = excluded.expires_at
+        WHERE scheduler_leases.slot < excluded.slot AND scheduler_leases.expires_at < ?
+    ''', (job, owner, slot, now + lease_seconds, now))
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def release_lease(conn, job, owner, status, duration):
+    conn.execute('''
+        UPDATE scheduler_leases SET expires_at = 0, last_finished_at = ?, last_status = ?, last_duration = ?
+        WHERE job = ? AND owner = ?
+    ''', (datetime.now().isoformat(), status, duration, job, owner))
+    conn.commit()
+
+
+# ============ SCHEDULER ============
+
+class Job:
+    def __init__(self, name, func, trigger, jitter=0.0, lease_seconds=3600):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.lease_seconds = lease_seconds
+
+
+class Scheduler:
+    """Runs registered jobs on their triggers; one task per job"""
+
+    def __init__(self, lease_db_path):
+        self.lease_db_path = lease_db_path
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.jobs = {}
+        self._tasks = []
+
+    def add(self, name, func, trigger, jitter=0.0, lease_seconds=3600):
+        """Register func() to run on `trigger`, delayed by up to `jitter` seconds"""
+        self.jobs[name] = Job(name, func, trigger, jitter, lease_seconds)
+
+    def start(self):
+        conn = sqlite3.connect(self.lease_db_path, timeout=30)
+        try:
+            init_scheduler(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self._tasks = [asyncio.create_task(self._job_loop(job)) for job in self.jobs.values()]
+        logger.info("Scheduler started: %s", ", ".join(f"{j.name} ({j.trigger!r})" for j in self.jobs.values()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _job_loop(self, job):
+        while True:
+            fire = job.trigger.next_fire(datetime.now())
+            # Jitter spreads identical schedules so processes don't stampede the lease
+            delay = (fire - datetime.now()).total_seconds() + random.uniform(0, job.jitter)
+            await asyncio.sleep(max(0.0, delay))
+            try:
+                await asyncio.to_thread(self.run_slot, job, fire.timestamp())
+            except Exception:
+                logger.exception("Scheduled job %s failed", job.name)
+
+    def run_slot(self, job, slot):
+        """Run one slot of `job` if this process wins its lease; returns whether it ran"""
+        conn = sqlite3.connect(self.lease_db_path, timeout=30)
+        try:
+            if not acquire_lease(conn, job.name, self.owner, slot, job.lease_seconds):
+                JOB_RUNS.inc(job.name, "skipped")
+                return False
+
+            start = time.perf_counter()
+            status = "error"
+            try:
+                job.func()
+                status = "ok"
+            finally:
+                duration = time.perf_counter() - start
+                JOB_DURATION.observe(duration, job.name, status)
+                JOB_RUNS.inc(job.name, status)
+                release_lease(conn, job.name, self.owner, status, duration)
+                logger.info("Job %s finished (%s) in %.3fs", job.name, status, duration)
+            return True
+        finally:
+            conn.close()
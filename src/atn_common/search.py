@@ -0,0 +1,157 @@
+"""ATN search - FTS5 indexes over agents and evaluation comments
+
+users_fts mirrors users.username/first_name (rowid = user_id) and
+evaluations_fts is an external-content index over evaluations.comment and
+task_type. Both are kept in sync by triggers, so any process writing the DB
+keeps search current. Queries are prefix queries on every term and are
+ranked with bm25; fuzzy_find_users() re-ranks prefix candidates by edit
+similarity to tolerate typos.
+"""
+
+import re
+from difflib import SequenceMatcher
+
+from .eventlog import LIVE_SCORE_SQL
+
+TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '_'"
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Join and page over only the best-ranked this many matches: a 2-letter
+# prefix can hit every row, and a bounded top-N sort is far cheaper than
+# sorting (and joining) a million equally poor matches
+MAX_CANDIDATES = 2000
+
+
+def init_search(conn):
+    """Create FTS5 tables and sync triggers, building the indexes on first run"""
+    exists = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE name IN ('users_fts', 'evaluations_fts')")}
+
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, first_name, tokenize="{TOKENIZER}", prefix='2 3'
+        )
+    ''')
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS evaluations_fts USING fts5(
+            comment, task_type, content='evaluations', content_rowid='id',
+            tokenize="{TOKENIZER}", prefix='2 3'
+        )
+    ''')
+
+    # users_fts stores its own copy so INSERT OR REPLACE on users (which skips
+    # delete triggers) can never leave it inconsistent
+    conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT OR REPLACE INTO users_fts (rowid, username, first_name)
+            VALUES (NEW.user_id, NEW.username, NEW.first_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_update AFTER UPDATE OF username, first_name ON users BEGIN
+            INSERT OR REPLACE INTO users_fts (rowid, username, first_name)
+            VALUES (NEW.user_id, NEW.username, NEW.first_name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_users_fts_delete AFTER DELETE ON users BEGIN
+            DELETE FROM users_fts WHERE rowid = OLD.user_id;
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS trg_evaluations_fts_insert AFTER INSERT ON evaluations BEGIN
+            INSERT INTO evaluations_fts (rowid, comment, task_type) VALUES (NEW.id, NEW.comment, NEW.task_type);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_evaluations_fts_delete AFTER DELETE ON evaluations BEGIN
+            INSERT INTO evaluations_fts (evaluations_fts, rowid, comment, task_type)
+            VALUES ('delete', OLD.id, OLD.comment, OLD.task_type);
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_evaluations_fts_update AFTER UPDATE OF comment, task_type ON evaluations BEGIN
+            INSERT INTO evaluations_fts (evaluations_fts, rowid, comment, task_type)
+            VALUES ('delete', OLD.id, OLD.comment, OLD.task_type);
+            INSERT INTO evaluations_fts (rowid, comment, task_type) VALUES (NEW.id, NEW.comment, NEW.task_type);
+        END;
+    ''')
+
+    if "users_fts" not in exists:
+        conn.execute("INSERT INTO users_fts (rowid, username, first_name) SELECT user_id, username, first_name FROM users")
+    if "evaluations_fts" not in exists:
+        conn.execute("INSERT INTO evaluations_fts (evaluations_fts) VALUES ('rebuild')")
+
+    # Exact @username lookups in the bot are case-insensitive
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username COLLATE NOCASE)")
+
+
+def build_match(query):
+    """Turn free text into a safe FTS5 query: every term quoted, prefix-matched, AND-ed"""
+    terms = _TERM_RE.findall(query.lower())
+    return " ".join(f'"{term}"*' for term in terms[:8])
+
+
+def search_users(conn, query, limit=20, offset=0):
+    """Agents whose username/first_name match every term, best match first"""
+    match = build_match(query)
+    if not match:
+        return []
+    return conn.execute(f'''
+        SELECT users.user_id, username, first_name, {LIVE_SCORE_SQL} AS score, is_agent, m.rank
+        FROM (
+            SELECT rowid, bm25(users_fts, 2.0, 1.0) AS rank FROM users_fts
+            WHERE users_fts MATCH ? ORDER BY rank LIMIT ?
+        ) m JOIN users ON users.user_id = m.rowid
+        ORDER BY m.rank, score DESC
+        LIMIT ? OFFSET ?
+    ''', (match, max(MAX_CANDIDATES, offset + limit), limit, offset)).fetchall()
+
+
+def search_evaluations(conn, query, limit=20, offset=0):
+    """Evaluations whose comment/task_type match every term, with a highlighted snippet
+
+    Rows are (id, from, to, rating, comment, task_type, created_at, snippet, rank).
+    """
+    match = build_match(query)
+    if not match:
+        return []
+    rows = conn.execute('''
+        SELECT e.id, e.from_user_id, e.to_user_id, e.rating, e.comment, e.task_type, e.created_at, m.rank
+        FROM (
+            SELECT rowid, bm25(evaluations_fts) AS rank FROM evaluations_fts
+            WHERE evaluations_fts MATCH ? ORDER BY rank, rowid DESC LIMIT ?
+        ) m JOIN evaluations e ON e.id = m.rowid
+        ORDER BY m.rank, e.id DESC
+        LIMIT ? OFFSET ?
+    ''', (match, max(MAX_CANDIDATES, offset + limit), limit, offset)).fetchall()
+    if not rows:
+        return []
+    
+    # Snippets only for the page being returned, not for every candidate
+    ids = [row[0] for row in rows]
+    snippets = dict(conn.execute(f'''
+        SELECT rowid, snippet(evaluations_fts, 0, '[', ']', '…', 12) FROM evaluations_fts
+        WHERE evaluations_fts MATCH ? AND rowid IN ({", ".join("?" * len(ids))})
+    ''', (match, *ids)).fetchall())
+    return [row[:7] + (snippets.get(row[0]), row[7]) for row in rows]
+
+
+def fuzzy_find_users(conn, query, limit=10, candidates=200, min_similarity=0.5):
+    """Prefix-search on the first letters, then re-rank by similarity to tolerate typos
+
+    "jhon" still finds "john": candidates come from the 2-character prefix
+    index and are scored against username and first_name.
+    """
+    terms = _TERM_RE.findall(query.lower())
+    if not terms:
+        return []
+    needle = " ".join(terms)
+    rows = search_users(conn, query, candidates)
+    if len(rows) < limit:
+        seen = {row[0] for row in rows}
+        rows += [row for row in search_users(conn, terms[0][:2], candidates) if row[0] not in seen]
+
+    scored = []
+    for row in rows:
+        names = [name.lower() for name in (row[1], row[2]) if name]
+        similarity = max(
+            (max(SequenceMatcher(None, needle, name).ratio(),
+                 SequenceMatcher(None, needle, name[:len(needle)]).ratio()) for name in names),
+            default=0.0,
+        )
+        if similarity >= min_similarity:
+            scored.append((similarity, row))
+    scored.sort(key=lambda item: (-item[0], -(item[1][3] or 0)))
+    return [row for _, row in scored[:limit]]
@@ -0,0 +1,144 @@
+"""ATN sharding - one SQLite file per tenant (Telegram chat or community)
+
+Off by default. With ATN_SHARD_DIR set, every tenant gets its own database
+file (tenant-<id>.db) holding its own users, evaluations and reputation log.
+Shards never share a write lock, so write throughput grows with the number of
+tenants. A ShardRouter maps tenant ids to files and creates the schema the
+first time a shard is opened.
+
+Tenants are routed by id only: the bot uses the group chat id (private chats
+go to ATN_DEFAULT_TENANT) and the API the X-ATN-Tenant header. Only the bot
+and reshard.py create shards; the API serves tenants that already have one.
+Cross-shard reads such as the global leaderboard stream every shard in score
+order and k-way merge them with a heap, so only the rows that make the final
+page are ever read. Moving users between shards is done offline with
+reshard.py.
+
+The bot's tenant middleware lives in src/bot/middleware.py.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+from itertools import islice
+
+from .eventlog import ARCHIVE_INTERVAL, COMPACT_INTERVAL, run_maintenance
+
+logger = logging.getLogger(__name__)
+
+# Empty = unsharded, every process uses the single DATABASE_URL file
+SHARD_DIR = os.getenv("ATN_SHARD_DIR", "")
+DEFAULT_TENANT = os.getenv("ATN_DEFAULT_TENANT", "default")
+
+# Telegram chat ids are negative integers; communities may use short slugs
+_TENANT_RE = re.compile(r"^-?[A-Za-z0-9_]{1,64}$")
+
+# Tenant of the update/request being handled
+current_tenant = ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+
+def validate_tenant(tenant):
+    tenant = str(tenant)
+    if not _TENANT_RE.match(tenant):
+        raise ValueError(f"Invalid tenant id: {tenant!r}")
+    return tenant
+
+
+class ShardRouter:
+    """Maps tenant ids to shard files, initialising each shard once per process"""
+
+    def __init__(self, shard_dir=SHARD_DIR, init=None):
+        self.shard_dir = shard_dir
+        self.init = init
+        self._ready = set()
+        self._lock = threading.Lock()
+
+    def path_for(self, tenant):
+        return os.path.join(self.shard_dir, f"tenant-{validate_tenant(tenant)}.db")
+
+    def tenants(self):
+        """Every tenant that has a shard on disk"""
+        if not os.path.isdir(self.shard_dir):
+            return []
+        return sorted(name[len("tenant-"):-len(".db")] for name in os.listdir(self.shard_dir)
+                      if name.startswith("tenant-") and name.endswith(".db"))
+
+    def ensure(self, tenant):
+        """Path of the tenant's shard, creating it (WAL + schema) on first use"""
+        path = self.path_for(tenant)
+        if path in self._ready:
+            return path
+        with self._lock:
+            if path not in self._ready:
+                os.makedirs(self.shard_dir, exist_ok=True)
+                conn = sqlite3.connect(path, timeout=30)
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    if self.init:
+                        self.init(conn)
+                    conn.commit()
+                finally:
+                    conn.close()
+                self._ready.add(path)
+        return path
+
+    def existing(self, tenant):
+        """Path of a tenant whose shard is already on disk; LookupError instead of creating it"""
+        path = self.path_for(tenant)
+        if path not in self._ready and not os.path.exists(path):
+            raise LookupError(f"Unknown tenant: {tenant}")
+        return self.ensure(tenant)
+
+    def connect(self, tenant, **kwargs):
+        return sqlite3.connect(self.ensure(tenant), timeout=30, **kwargs)
+
+
+# ============ CROSS-SHARD READS ============
+
+def iter_pages(fetch, page_size=100):
+    """Yield rows from fetch(limit, offset) page by page until it runs dry"""
+    offset = 0
+    while True:
+        rows = fetch(page_size, offset)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        offset += page_size
+
+
+def merge_ranked(streams, limit, key, distinct=None):
+    """Top `limit` entries of several streams each already sorted by key DESC
+
+    heapq.merge keeps one pending entry per stream, so with k shards a page
+    of n entries costs O(n log k) and reads about n rows per shard at most.
+    With `distinct`, only the first (highest) entry per distinct(entry) is kept.
+    """
+    merged = heapq.merge(*streams, key=key, reverse=True)
+    if distinct is not None:
+        seen = set()
+        merged = (entry for entry in merged
+                  if distinct(entry) not in seen and not seen.add(distinct(entry)))
+    return list(islice(merged, limit))
+
+
+# ============ MAINTENANCE ============
+
+async def compact_shards_loop(router, interval=COMPACT_INTERVAL, archive_interval=ARCHIVE_INTERVAL):
+    """compactor_loop for every shard; each shard archives into its own segment directory"""
+    last_archive = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        archive = time.monotonic() - last_archive >= archive_interval
+        for tenant in router.tenants():
+            try:
+                await asyncio.to_thread(run_maintenance, router.ensure(tenant), archive)
+            except sqlite3.Error:
+                logger.exception("Compaction failed for tenant %s", tenant)
+        if archive:
+            last_archive = time.monotonic()
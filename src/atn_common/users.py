@@ -0,0 +1,43 @@
+"""ATN users - bot writes to user rows and scores
+
+The bot runs these directly on its own connection, or, in writer mode,
+sends them to the writer process (src/api/writer.py WRITE_OPS) so that no
+other process ever writes the DB. Each op runs inside a transaction owned
+by the caller and must not commit.
+"""
+
+from datetime import datetime
+
+from .eventlog import append_event
+from .idempotency import claim_key
+
+
+def create_user(conn, user_id, username, first_name):
+    """Create (or re-create) a user row on first contact"""
+    now = datetime.now().isoformat()
+    conn.execute(
+        "INSERT OR REPLACE INTO users (user_id, username, first_name, registered_at, last_active) VALUES (?, ?, ?, ?, ?)",
+        (user_id, username, first_name, now, now)
+    )
+    return {"status": "success", "user_id": user_id}
+
+
+def set_agent(conn, user_id):
+    """Flag a user as a registered agent"""
+    conn.execute("UPDATE users SET is_agent = 1 WHERE user_id = ?", (user_id,))
+    return {"status": "success", "user_id": user_id}
+
+
+def record_task_completed(conn, user_id):
+    """Bump a user's tasks_completed counter"""
+    conn.execute("UPDATE users SET tasks_completed = tasks_completed + 1 WHERE user_id = ?", (user_id,))
+    return {"status": "success", "user_id": user_id}
+
+
+def apply_score_change(conn, user_id, score_change, reason, idempotency_key=None, actor_id=None):
+    """Log a reputation change (bot score updates); actor_id is the evaluator, if any"""
+    result = {"status": "success", "user_id": user_id, "change": score_change}
+    if idempotency_key:
+        claim_key(conn, idempotency_key, result)
+    append_event(conn, user_id, score_change, reason, actor_id=actor_id)
+    return result
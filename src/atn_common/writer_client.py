@@ -0,0 +1,82 @@
+"""ATN writer client - send write ops to the single-writer process
+
+The API workers and the bot both use this client; the server side is
+src/api/writer.py. multiprocessing.connection unpickles whatever it
+receives, so both ends refuse to run without an explicit
+ATN_WRITER_AUTHKEY: only a peer holding the key can get a message through.
+"""
+
+import os
+import threading
+from multiprocessing.connection import Client
+
+from .idempotency import DuplicateRequest
+
+# Empty address = writer mode disabled, every process writes directly
+WRITER_ADDRESS = os.getenv("ATN_WRITER_ADDRESS", "")
+WRITER_AUTHKEY = os.getenv("ATN_WRITER_AUTHKEY", "").encode()
+
+
+def parse_address(address):
+    """Turn 'host:port' into an AF_INET tuple, anything else is a unix socket path"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def require_authkey(authkey):
+    if not authkey:
+        raise RuntimeError("Writer mode needs ATN_WRITER_AUTHKEY set to a shared secret")
+    return authkey
+
+
+class WriterClient:
+    """Thread-safe client for the writer process, one socket per calling thread"""
+
+    def __init__(self, address=WRITER_ADDRESS, authkey=WRITER_AUTHKEY):
+        self.address = parse_address(address)
+        self.authkey = require_authkey(authkey)
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # No reply is outstanding between calls, so a readable socket means the writer hung up
+        if conn is not None and conn.poll():
+            self._drop()
+            conn = None
+        if conn is None:
+            conn = Client(self.address, authkey=self.authkey)
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def submit(self, op, **kwargs):
+        """Send one write op and block until the writer has committed it"""
+        try:
+            conn = self._connection()
+            conn.send((op, kwargs))
+        except OSError:
+            # The op never reached the writer, so sending it again cannot apply it twice
+            self._drop()
+            conn = self._connection()
+            conn.send((op, kwargs))
+        try:
+            status, payload = conn.recv()
+        except (EOFError, OSError):
+            # The writer may have committed before it went away; never resend here
+            self._drop()
+            raise
+
+        if status == "not_found":
+            raise LookupError(payload)
+        if status == "duplicate":
+            raise DuplicateRequest(payload)
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload
@@ -17,3 +17,13 @@ RPC_URL = os.getenv("RPC_URL", "https://rpc.example.com")
 
 # Admin IDs (comma-separated)
 ADMIN_IDS = [int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x]
+
+# Single-writer mode: forward every write to the API writer process; the
+# authkey is required there, the writer unpickles what it receives
+WRITER_ADDRESS = os.getenv("ATN_WRITER_ADDRESS", "")
+WRITER_AUTHKEY = os.getenv("ATN_WRITER_AUTHKEY", "").encode()
+
+# Prometheus scrape port for the bot (0 disables the exporter); localhost
+# only unless ATN_BOT_METRICS_HOST says otherwise (e.g. 0.0.0.0)
+METRICS_PORT = int(os.getenv("ATN_BOT_METRICS_PORT", "9101"))
+METRICS_HOST = os.getenv("ATN_BOT_METRICS_HOST", "127.0.0.1")
@@ -1,17 +1,37 @@
 """ATN Telegram Bot - Main entry point with complete functionality"""
 
 import asyncio
+import html
 import logging
+import os
 import sqlite3
+import sys
 import http.server
 import socketserver
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from datetime import datetime
 
-# Configuration
-from config import TELEGRAM_BOT_TOKEN, DATABASE_URL
+# Configuration (loads .env before the shared modules read their ATN_* settings)
+from config import TELEGRAM_BOT_TOKEN, DATABASE_URL, WRITER_ADDRESS, WRITER_AUTHKEY, METRICS_HOST, METRICS_PORT, ADMIN_IDS
+
+# src/ holds the atn_common package shared with the API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from atn_common.adjustments import MAX_TASK_WEIGHT, create_job, get_job, init_adjustments, list_jobs, resume_job  # noqa: E402
+from atn_common.eventlog import LIVE_SCORE_SQL, LIVE_TOP_CTE, compactor_loop, init_eventlog, live_rank, read_history  # noqa: E402
+from atn_common.idempotency import DuplicateRequest, init_idempotency  # noqa: E402
+from atn_common.maintenance import register_maintenance_jobs  # noqa: E402
+from atn_common.metrics import METRICS_ENABLED, db_factory, start_metrics_server  # noqa: E402
+from atn_common.profiling import PROFILE_DIR  # noqa: E402
+from atn_common.scheduler import SCHEDULER_ENABLED, Scheduler, init_scheduler  # noqa: E402
+from atn_common.search import fuzzy_find_users, init_search  # noqa: E402
+from atn_common.sharding import DEFAULT_TENANT, SHARD_DIR, ShardRouter, compact_shards_loop, current_tenant  # noqa: E402
+from atn_common import users as user_ops  # noqa: E402
+from atn_common.writer_client import WriterClient  # noqa: E402
+
+from middleware import (CommandMetricsMiddleware, ProfilingMiddleware, TenantMiddleware,  # noqa: E402
+                        UpdateDedupMiddleware, profiled_admins)
 
 # Logging
 logging.basicConfig(
@@ -24,13 +44,47 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
 
+if METRICS_ENABLED:
+    dp.message.middleware(CommandMetricsMiddleware())
+    dp.callback_query.middleware(CommandMetricsMiddleware())
+
+dp.message.middleware(ProfilingMiddleware())
+dp.callback_query.middleware(ProfilingMiddleware())
+
+# Telegram redelivers updates it thinks were lost; handle each update_id once
+dp.update.outer_middleware(UpdateDedupMiddleware())
+
+# Sharded mode: each group chat gets its own DB file
+if SHARD_DIR:
+    dp.update.outer_middleware(TenantMiddleware())
+
 # Database path
 DB_PATH = DATABASE_URL.replace("sqlite:///", "")
 
+# Single-writer mode: every write goes to the API's writer process (src/api/writer.py)
+writer_client = WriterClient(WRITER_ADDRESS, WRITER_AUTHKEY) if WRITER_ADDRESS else None
 
-def init_database():
-    """Initialize SQLite database"""
-    conn = sqlite3.connect(DB_PATH)
+
+def submit_write(op, func, **kwargs):
+    """Run a write op through the writer in writer mode, else on this process's DB
+
+    Raises LookupError for unknown targets, DuplicateRequest for a reused
+    idempotency key, and ValueError (RuntimeError via the writer) for bad input.
+    """
+    if writer_client:
+        return writer_client.submit(op, **kwargs)
+    
+    conn = connect_db()
+    try:
+        result = func(conn, **kwargs)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+
+def init_tables(conn):
+    """Create the bot's tables in one database (the shared DB or a tenant shard)"""
     cursor = conn.cursor()
     
     # Create users table
@@ -58,32 +112,113 @@ def init_database():
         )
     ''')
     
+    # Evaluations table (shared with the API)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS evaluations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            to_user_id INTEGER,
+            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+            comment TEXT,
+            task_type TEXT,
+            created_at TEXT
+        )
+    ''')
+    
+    # Compaction watermark for the append-only reputation log
+    init_eventlog(conn)
+    
+    # FTS5 indexes behind /find
+    init_search(conn)
+    
+    # Idempotency keys shared with the API
+    init_idempotency(conn)
+    
+    # Lease rows that keep scheduled jobs single-flight across processes
+    init_scheduler(conn)
+    
+    # Admin adjustment jobs and task weights
+    init_adjustments(conn)
+
+
+# Sharded mode: one DB file per tenant, created on first use
+shard_router = ShardRouter(init=init_tables) if SHARD_DIR else None
+
+
+def init_database():
+    """Initialize SQLite database"""
+    if shard_router:
+        shard_router.ensure(DEFAULT_TENANT)
+        logger.info(f"Sharded database initialized in {SHARD_DIR}")
+        return
+    if writer_client:
+        # The writer creates the (superset) schema; the bot never writes the DB itself
+        logger.info("Writer mode: database schema is owned by the writer")
+        return
+    
+    conn = sqlite3.connect(DB_PATH, factory=db_factory)
+    # WAL so the API's read-only workers never block on bot writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    init_tables(conn)
     conn.commit()
     conn.close()
     logger.info("Database initialized")
 
 
-def get_user_reputation_history(user_id):
-    """Get user's reputation history"""
-    conn = sqlite3.connect(DB_PATH)
+def maintained_db_paths():
+    if shard_router:
+        return [shard_router.ensure(tenant) for tenant in shard_router.tenants()]
+    return [DB_PATH]
+
+
+def connect_db():
+    """Connection to the current update's database (its tenant shard in sharded mode)"""
+    if shard_router:
+        return shard_router.connect(current_tenant.get(), factory=db_factory)
+    return sqlite3.connect(DB_PATH, factory=db_factory)
+
+
+# reputation_score includes events the compactor has not folded in yet
+USER_COLUMNS = f"user_id, username, first_name, {LIVE_SCORE_SQL}, tasks_completed, registered_at, last_active, is_agent"
+
+
+def get_user(user_id):
+    """Get a user row by Telegram ID"""
+    conn = connect_db()
     cursor = conn.cursor()
-    cursor.execute(
-        "SELECT change, reason, timestamp FROM reputation_log WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20",
-        (user_id,)
-    )
-    history = cursor.fetchall()
+    cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE user_id = ?", (user_id,))
+    user = cursor.fetchone()
+    conn.close()
+    return user
+
+
+def get_user_by_username(username):
+    """Get a user row by Telegram username (without the @), case-insensitive"""
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {USER_COLUMNS} FROM users WHERE username = ? COLLATE NOCASE", (username,))
+    user = cursor.fetchone()
+    conn.close()
+    return user
+
+
+def get_user_reputation_history(user_id):
+    """Get user's reputation history (live log first, then archived segments)"""
+    conn = connect_db()
+    history = read_history(conn, user_id, limit=20)
     conn.close()
     return history
 
 
 def get_leaderboard(limit=10):
     """Get top users by reputation"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
     cursor.execute(
-        """SELECT user_id, username, first_name, reputation_score, tasks_completed, is_agent 
-           FROM users ORDER BY reputation_score DESC LIMIT ?""",
-        (limit,)
+        f"""WITH {LIVE_TOP_CTE}
+           SELECT user_id, username, first_name, live_score, tasks_completed, is_agent
+           FROM live_top ORDER BY live_score DESC LIMIT :top""",
+        {"top": limit}
     )
     leaderboard = cursor.fetchall()
     conn.close()
@@ -113,47 +248,24 @@ def format_reputation_change(change):
 
 def create_user(user_id, username, first_name):
     """Create new user in database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    now = datetime.now().isoformat()
-    cursor.execute(
-        "INSERT OR REPLACE INTO users (user_id, username, first_name, registered_at, last_active) VALUES (?, ?, ?, ?, ?)",
-        (user_id, username, first_name, now, now)
-    )
-    conn.commit()
-    conn.close()
+    submit_write("create_user", user_ops.create_user, user_id=user_id, username=username, first_name=first_name)
 
 
-def update_user_score(user_id, score_change, reason):
-    """Update user reputation score"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    now = datetime.now().isoformat()
-    
-    cursor.execute(
-        "UPDATE users SET reputation_score = reputation_score + ?, last_active = ? WHERE user_id = ?",
-        (score_change, now, user_id)
-    )
-    
-    cursor.execute(
-        "INSERT INTO reputation_log (user_id, change, reason, timestamp) VALUES (?, ?, ?, ?)",
-        (user_id, score_change, reason, now)
-    )
-    
-    conn.commit()
-    conn.close()
+def update_user_score(user_id, score_change, reason, idempotency_key=None, actor_id=None):
+    """Update user reputation score; raises DuplicateRequest if the key was already used"""
+    # Append only; the compactor folds it into users.reputation_score
+    submit_write("update_user_score", user_ops.apply_score_change, user_id=user_id, score_change=score_change,
+                 reason=reason, idempotency_key=idempotency_key, actor_id=actor_id)
+
+
+def register_agent(user_id):
+    """Mark user as a registered agent"""
+    submit_write("set_agent", user_ops.set_agent, user_id=user_id)
 
 
 def update_user_tasks(user_id):
     """Increment tasks completed count"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET tasks_completed = tasks_completed + 1 WHERE user_id = ?",
-        (user_id,)
-    )
-    conn.commit()
-    conn.close()
+    submit_write("record_task_completed", user_ops.record_task_completed, user_id=user_id)
 
 
 # Inline keyboard for main menu
@@ -213,11 +325,7 @@ async def cmd_register(message: Message):
     )
     
     # Update user's agent status
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET is_agent = 1 WHERE user_id = ?", (user.id,))
-    conn.commit()
-    conn.close()
+    register_agent(user.id)
     
     logger.info(f"User {user.id} registered as agent")
 
@@ -300,10 +408,8 @@ async def cmd_reputation(message: Message):
         history = get_user_reputation_history(user_id)
         
         # Get rank
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) + 1 FROM users WHERE reputation_score > ?", (score,))
-        rank = cursor.fetchone()[0]
+        conn = connect_db()
+        rank = live_rank(conn, score)
         conn.close()
         
         history_text = ""
@@ -335,10 +441,8 @@ async def cmd_reputation(message: Message):
         history = get_user_reputation_history(user.id)
         
         # Get rank
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) + 1 FROM users WHERE reputation_score > ?", (score,))
-        rank = cursor.fetchone()[0]
+        conn = connect_db()
+        rank = live_rank(conn, score)
         conn.close()
         
         history_text = ""
@@ -425,10 +529,8 @@ async def cmd_leaderboard(message: Message):
         user = get_user(message.from_user.id)
         if user:
             user_id, username, first_name, score, tasks, registered, last_active, is_agent = user
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) + 1 FROM users WHERE reputation_score > ?", (score,))
-            user_rank = cursor.fetchone()[0]
+            conn = connect_db()
+            user_rank = live_rank(conn, score)
             conn.close()
             
             if user_rank > 10:
@@ -492,22 +594,25 @@ async def cmd_evaluate(message: Message):
     # Calculate reputation points (1-5 rating = 2-10 points)
     points = rating * 2
     
-    # Update target user's score
-    update_user_score(
-        target_id,
-        points,
-        f"Evaluation from @{user.username or user.first_name}: {rating}/5 stars"
-    )
+    # Update target user's score; a redelivered message must not award twice
+    try:
+        update_user_score(
+            target_id,
+            points,
+            f"Evaluation from @{user.username or user.first_name}: {rating}/5 stars",
+            idempotency_key=f"tg:{message.chat.id}:{message.message_id}",
+            # /revoke finds the evaluator's events by id, whatever their name is now
+            actor_id=user.id
+        )
+    except DuplicateRequest:
+        await message.answer(
+            f"ℹ️ This evaluation of @{target_username} was already recorded.",
+            parse_mode="HTML"
+        )
+        return
     
     # Update evaluator's evaluation count (for tracking)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET tasks_completed = tasks_completed + 1 WHERE user_id = ?",
-        (user.id,)
-    )
-    conn.commit()
-    conn.close()
+    update_user_tasks(user.id)
     
     await message.answer(
         f"✅ <b>Evaluation Submitted!</b>\n\n"
@@ -518,6 +623,179 @@ async def cmd_evaluate(message: Message):
     )
 
 
+@dp.message(Command("find"))
+async def cmd_find(message: Message):
+    """Handle /find command - Fuzzy search for agents by name"""
+    args = message.text.split(maxsplit=1)[1:] if message.text else []
+    query = args[0].strip().lstrip('@') if args else ""
+    
+    if not query:
+        await message.answer(
+            "🔎 <b>Find an Agent</b>\n\n"
+            "Usage: /find name\n\n"
+            "Example: /find joh",
+            parse_mode="HTML"
+        )
+        return
+    
+    conn = connect_db()
+    matches = fuzzy_find_users(conn, query, limit=10)
+    conn.close()
+    
+    if not matches:
+        await message.answer(f"❌ No agents matching \"{html.escape(query)}\".", parse_mode="HTML")
+        return
+    
+    find_text = f"🔎 <b>Agents matching \"{html.escape(query)}\"</b>\n\n"
+    for user_id, username, first_name, score, is_agent, _ in matches:
+        agent_badge = " ✅" if is_agent else ""
+        handle = f"@{username}" if username else first_name
+        find_text += f"• <b>{html.escape(handle or str(user_id))}</b>{agent_badge} - ⭐ {score}\n"
+    
+    await message.answer(find_text, reply_markup=get_main_keyboard(), parse_mode="HTML")
+
+
+@dp.message(Command("profiling"))
+async def cmd_profiling(message: Message):
+    """Handle /profiling on|off - Admin only, profile your own subsequent commands"""
+    user = message.from_user
+    if user.id not in ADMIN_IDS:
+        await message.answer("❌ This command is only available to admins.")
+        return
+    
+    args = message.text.split()[1:]
+    if args and args[0].lower() == "on":
+        profiled_admins.add(user.id)
+    elif args and args[0].lower() == "off":
+        profiled_admins.discard(user.id)
+    
+    state = "ON" if user.id in profiled_admins else "OFF"
+    await message.answer(
+        f"🔬 Profiling for your commands: {state}\n"
+        f"Flamegraph files are written to {PROFILE_DIR}/\n\n"
+        f"Usage: /profiling on|off"
+    )
+
+
+def format_adjustment(job):
+    """One-line summary of an adjustment job for admin replies"""
+    what = (f"revoke evaluations by {job['target']}" if job["kind"] == "revoke_evaluations"
+            else f"reweight {job['target']} to x{job['weight']:g}")
+    line = (f"#{job['id']} {html.escape(what)} - <b>{job['status']}</b> {job['progress']:.0%} "
+            f"({job['processed']} adjusted), score {format_reputation_change(job['score_delta'])}")
+    if job["error"]:
+        line += f"\n   ⚠️ {html.escape(job['error'])}"
+    return line
+
+
+@dp.message(Command("revoke"))
+async def cmd_revoke(message: Message):
+    """Handle /revoke @user - Admin only, take back every evaluation the user gave"""
+    user = message.from_user
+    if user.id not in ADMIN_IDS:
+        await message.answer("❌ This command is only available to admins.")
+        return
+    
+    args = message.text.split()[1:]
+    if not args:
+        await message.answer("Usage: /revoke @username")
+        return
+    
+    target_username = args[0].lstrip('@')
+    target_user = get_user_by_username(target_username)
+    if not target_user:
+        await message.answer(f"❌ User @{html.escape(target_username)} not found.", parse_mode="HTML")
+        return
+    
+    try:
+        job = submit_write("create_adjustment", create_job, kind="revoke_evaluations", target=target_user[0],
+                           requested_by=f"tg:{user.id}")
+    except (LookupError, ValueError, RuntimeError) as e:
+        await message.answer(f"❌ {html.escape(str(e))}", parse_mode="HTML")
+        return
+    
+    await message.answer(
+        f"🧹 <b>Revocation queued</b>\n\n{format_adjustment(job)}\n\n"
+        f"Check progress with /adjustments {job['id']}",
+        parse_mode="HTML"
+    )
+
+
+@dp.message(Command("reweight"))
+async def cmd_reweight(message: Message):
+    """Handle /reweight task_type weight - Admin only, rescale a task type's awards"""
+    user = message.from_user
+    if user.id not in ADMIN_IDS:
+        await message.answer("❌ This command is only available to admins.")
+        return
+    
+    args = message.text.split()[1:]
+    try:
+        task_type, weight = args[0].strip().lower(), float(args[1])
+        if not 0 <= weight <= MAX_TASK_WEIGHT:
+            raise ValueError()
+    except (IndexError, ValueError):
+        await message.answer(f"Usage: /reweight task_type weight (0-{MAX_TASK_WEIGHT:g}, 1 = normal)")
+        return
+    
+    try:
+        job = submit_write("create_adjustment", create_job, kind="reweight_task_type", target=task_type,
+                           weight=weight, requested_by=f"tg:{user.id}")
+    except (LookupError, ValueError, RuntimeError) as e:
+        await message.answer(f"❌ {html.escape(str(e))}", parse_mode="HTML")
+        return
+    
+    await message.answer(
+        f"⚖️ <b>Re-weight queued</b>\n\n{format_adjustment(job)}\n\n"
+        f"New {html.escape(task_type)} evaluations use the new weight now.\n"
+        f"Check progress with /adjustments {job['id']}",
+        parse_mode="HTML"
+    )
+
+
+@dp.message(Command("adjustments"))
+async def cmd_adjustments(message: Message):
+    """Handle /adjustments [id | resume id] - Admin only, adjustment job progress"""
+    user = message.from_user
+    if user.id not in ADMIN_IDS:
+        await message.answer("❌ This command is only available to admins.")
+        return
+    
+    args = message.text.split()[1:]
+    resume = len(args) == 2 and args[0].lower() == "resume"
+    if args and not (args[-1].isdigit() and (resume or len(args) == 1)):
+        await message.answer("Usage: /adjustments [id | resume id]")
+        return
+    
+    try:
+        if resume:
+            jobs = [submit_write("resume_adjustment", resume_job, job_id=int(args[1]))]
+        elif args:
+            conn = connect_db()
+            try:
+                jobs = [get_job(conn, int(args[0]))]
+            finally:
+                conn.close()
+        else:
+            conn = connect_db()
+            try:
+                jobs = list_jobs(conn, limit=10)
+            finally:
+                conn.close()
+    except (LookupError, ValueError, RuntimeError) as e:
+        await message.answer(f"❌ {html.escape(str(e))}", parse_mode="HTML")
+        return
+    
+    if not jobs:
+        await message.answer("No adjustment jobs yet. Use /revoke or /reweight.")
+        return
+    
+    await message.answer(
+        "🛠 <b>Adjustment jobs</b>\n\n" + "\n".join(format_adjustment(job) for job in jobs),
+        parse_mode="HTML"
+    )
+
+
 @dp.message(Command("help"))
 async def cmd_help(message: Message):
     """Handle /help command"""
@@ -530,6 +808,7 @@ async def cmd_help(message: Message):
         "• /reputation [@user] - Check reputation details\n"
         "• /leaderboard - View top agents\n"
         "• /evaluate @user rating [comment] - Rate an agent\n"
+        "• /find name - Search agents by name\n"
         "• /score - Quick reputation check\n"
         "• /help - Show this help message\n\n"
         "🎯 <b>Features:</b>\n"
@@ -566,10 +845,12 @@ async def handle_callback(callback: CallbackQuery):
         await cmd_score(callback.message)
     elif data == "leaderboard":
         # Get top 5 users
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute(
-            "SELECT first_name, reputation_score, tasks_completed FROM users ORDER BY reputation_score DESC LIMIT 5"
+            f"WITH {LIVE_TOP_CTE} SELECT first_name, live_score, tasks_completed FROM live_top "
+            "ORDER BY live_score DESC LIMIT :top",
+            {"top": 5}
         )
         top_users = cursor.fetchall()
         conn.close()
@@ -601,6 +882,23 @@ async def main():
     """Main entry point"""
     logger.info("Starting ATN Bot...")
     init_database()
+    if METRICS_ENABLED and METRICS_PORT:
+        start_metrics_server(METRICS_PORT, METRICS_HOST)
+        logger.info(f"Metrics exporter listening on {METRICS_HOST}:{METRICS_PORT}")
+    # In writer mode the writer process owns compaction
+    if shard_router:
+        if WRITER_ADDRESS:
+            raise SystemExit("ATN_SHARD_DIR and ATN_WRITER_ADDRESS cannot be combined")
+        asyncio.create_task(compact_shards_loop(shard_router))
+    elif not WRITER_ADDRESS:
+        asyncio.create_task(compactor_loop(DB_PATH))
+    
+    # VACUUM/ANALYZE/checkpoints etc.; leases keep them single-flight with the API.
+    # In writer mode the writer process schedules them, since the bot never writes the DB
+    if SCHEDULER_ENABLED and not WRITER_ADDRESS:
+        scheduler = Scheduler(shard_router.path_for(DEFAULT_TENANT) if shard_router else DB_PATH)
+        register_maintenance_jobs(scheduler, maintained_db_paths)
+        scheduler.start()
     await dp.start_polling(bot)
 
 
@@ -0,0 +1,92 @@
+"""ATN bot middleware - aiogram glue around the shared atn_common modules
+
+Command timing, update_id dedup, per-group shard routing and sampling
+profiling. The modules they wrap are shared with the API; only the aiogram
+side lives here.
+"""
+
+import time
+
+from aiogram import BaseMiddleware
+
+from atn_common.idempotency import RecentKeys
+from atn_common.metrics import Histogram
+from atn_common.profiling import StackSampler, should_sample
+from atn_common.sharding import DEFAULT_TENANT, current_tenant
+
+COMMAND_DURATION = Histogram("atn_bot_command_duration_seconds", "Bot handler latency by command",
+                             ("command", "status"))
+
+# Admin user IDs who turned on /profiling for their own commands
+profiled_admins = set()
+
+
+def _handler_name(data):
+    callback = getattr(data.get("handler"), "callback", None)
+    return getattr(callback, "__name__", "unhandled")
+
+
+class CommandMetricsMiddleware(BaseMiddleware):
+    """Time each handler, labelled by handler name (cmd_start, handle_callback, ...)"""
+
+    async def __call__(self, handler, event, data):
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            COMMAND_DURATION.observe(time.perf_counter() - start, _handler_name(data), status)
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """Drop Telegram updates whose update_id was already handled by this process
+
+    Register as an outer middleware on dp.update. After a restart the
+    in-memory set is empty; keyed writes are then caught by idempotency_keys.
+    """
+
+    def __init__(self, recent=None):
+        self.recent = recent or RecentKeys("update_dedup")
+
+    async def __call__(self, handler, event, data):
+        key = str(event.update_id)
+        if self.recent.get(key) is not None:
+            return None
+        self.recent.add(key)
+        return await handler(event, data)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Route each update to its group's shard; private chats use the default tenant
+
+    Register as an outer middleware on dp.update, after aiogram has resolved
+    event_chat. Handlers open their connections through current_tenant.
+    """
+
+    async def __call__(self, handler, event, data):
+        chat = data.get("event_chat")
+        tenant = str(chat.id) if chat is not None and chat.type in ("group", "supergroup") else DEFAULT_TENANT
+        token = current_tenant.set(tenant)
+        try:
+            return await handler(event, data)
+        finally:
+            current_tenant.reset(token)
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Profile 1 in ATN_PROFILE_EVERY updates plus every update from an admin with /profiling on"""
+
+    async def __call__(self, handler, event, data):
+        user = getattr(event, "from_user", None)
+        forced = user is not None and user.id in profiled_admins
+        if not (forced or should_sample()):
+            return await handler(event, data)
+
+        sampler = StackSampler().start()
+        try:
+            return await handler(event, data)
+        finally:
+            sampler.stop(f"bot {_handler_name(data)}")